@@ -1,7 +1,7 @@
 from pipeline.instance import Instance
 from pipeline.session import Session, SessionInput, SessionOutput
 from einsum.core import *
-from functools import reduce
+from pipeline.factorize import get_divisors, get_divisor_set
 from dataclasses import dataclass, asdict
 from config.arch import ArchConfig, PE
 from typing import List, Dict
@@ -74,23 +74,25 @@ class Baseline(ABC):
         pass
 
     def eval_einsums(self, einsums: Einsums, outdir: Path) -> BaselineOutputs:
-        acc_inps = {}
-        tl_rsts: Dict[str, SessionOutput] = {}
-        latency = {}
-        for einsum in einsums.names:
-            print(f"Running {self.name} einsum {einsum} ...")
-            einsum = Einsum.load_from_einsums(name=einsum, einsums=einsums)
+        def eval_one(name: str):
+            print(f"Running {self.name} einsum {name} ...")
+            einsum = Einsum.load_from_einsums(name=name, einsums=einsums)
 
             einsum_outdir = outdir / einsum.name
             tl_rst = self.eval_einsum(einsum, einsum_outdir)
 
             print(f"Finished {self.name} einsum {einsum.name}.")
 
-            tl_rsts[einsum.name] = tl_rst
-            latency[einsum.name] = max(tl_rst.tl_rst.comp_latency, tl_rst.tl_rst.mem_latency)
-
             acc_inp = AccelergyInput.load_from_tl_outdir(einsum_outdir, einsum.einsums.compute_cost[einsum.name])
-            acc_inps[einsum.name] = acc_inp
+            return einsum.name, tl_rst, acc_inp
+
+        acc_inps = {}
+        tl_rsts: Dict[str, SessionOutput] = {}
+        latency = {}
+        for name, tl_rst, acc_inp in self.session.map(eval_one, einsums.names):
+            tl_rsts[name] = tl_rst
+            latency[name] = max(tl_rst.tl_rst.comp_latency, tl_rst.tl_rst.mem_latency)
+            acc_inps[name] = acc_inp
 
         total_latency = self.get_total_latency(latency)
 
@@ -105,9 +107,9 @@ class Baseline(ABC):
         )
 
     def assign_HEF(self, H, E, M) -> Dict[str, int]:
-        factors_H = self.factors(H)
-        factors_E = self.factors(E)
-        factors_M = self.factors(M)
+        factors_H = get_divisors(H)[::-1]
+        factors_E = get_divisors(E)[::-1]
+        factors_M = get_divisor_set(M)
 
         rst_h = 1
         rst_e = 1
@@ -1,6 +1,6 @@
 from baseline.base import Baseline, FusedBaselineOptions, BaselineOutputs
 from einsum.core import *
-from functools import reduce
+from pipeline.factorize import get_divisors
 from dataclasses import asdict
 from config.arch import PE
 from typing import List, Dict
@@ -78,11 +78,7 @@ class FuseMax(Baseline):
         return MHA_EINSUMS
 
     def factors(self, n):
-        # Source:
-        # https://stackoverflow.com/questions/6800193/what-is-the-most-efficient-way-of-finding-all-the-factors-of-a-number-in-python
-        factors = list(reduce(list.__add__, ([i, n//i] for i in range(1, int(n**0.5) + 1) if n % i == 0)))
-        factors.sort(reverse=True)
-        return factors
+        return get_divisors(n)[::-1]
 
     def build_factors(self, dimensions: List[str], pe: PE) -> Dict[str, Dict[str, int]]:
         instance = asdict(self.instance)
@@ -1,10 +1,12 @@
 import timeloopfe.v4 as tl
 from typing import Union, List, Dict
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from io_config.stats import StatsOutput
 from config.arch import ArchConfig
 
+COMPONENTS_DIR = Path(__file__).parent / "_components"
+
 @dataclass
 class TimeloopResult:
     comp_latency: float
@@ -15,6 +17,7 @@ class TimeloopResult:
     traffic_energy_foreach: Dict
     mac_instances: int
     mac_utilized_instances: int
+    dataspace_traffic: Dict[str, Dict[str, Dict[str, int]]] = field(default_factory=dict)
 
 def eval_model(
     inputs: List[Union[str, Path]],
@@ -25,6 +28,16 @@ def eval_model(
 ) -> TimeloopResult:
     run_model(inputs, outdir)
     stats = StatsOutput.load_from_outdir(outdir=outdir)
+    return load_result(stats, arch_config, compute_cost, check_llb)
+
+def load_result(
+    stats: StatsOutput,
+    arch_config: ArchConfig,
+    compute_cost: Dict[str, int],
+    check_llb: bool=False
+) -> TimeloopResult:
+    """Build the TimeloopResult of an einsum from its (already generated) stats.
+    """
     return TimeloopResult(
         comp_latency=stats.get_compute_latency(arch_config.global_clock) * sum(compute_cost.values()),
         mem_latency=stats.get_mem_latency(mem_bandwidth=arch_config.bandwidth, check_llb=check_llb),
@@ -33,7 +46,8 @@ def eval_model(
         traffic_energy=stats.estimate_traffic_energy(arch_config),
         traffic_energy_foreach=stats.estimate_traffic_energy_eachlevel(arch_config),
         mac_instances=stats.read_mac_instances(),
-        mac_utilized_instances=stats.read_mac_utilized_instances()
+        mac_utilized_instances=stats.read_mac_utilized_instances(),
+        dataspace_traffic=stats.get_dataspace_traffic()
     )
 
 def run_model(inputs: List[Union[str, Path]], outdir: Union[str, Path]):
@@ -46,7 +60,7 @@ def run_model(inputs: List[Union[str, Path]], outdir: Union[str, Path]):
     _inputs = []
     for i in inputs:
         _inputs.append(str(i))
-    _inputs.append(str(Path(__file__).parent / "_components" / "*"))
+    _inputs.append(str(COMPONENTS_DIR / "*"))
 
     spec = tl.Specification.from_yaml_files(*_inputs)
 
@@ -1,11 +1,36 @@
-from typing import Union, Tuple, List
+from typing import Union, Tuple, List, Dict
 from pathlib import Path
+from dataclasses import dataclass, field
+import os
+import threading
 from config.arch import ArchConfig
 
+@dataclass
+class DataspaceStats:
+    name: str
+    reads: int = 0
+    fills: int = 0
+    updates: int = 0
+
+@dataclass
+class LevelStats:
+    name: str
+    lines: List[str] = field(default_factory=list)
+    dataspaces: List[DataspaceStats] = field(default_factory=list)
+
 class StatsOutput:
+    #  (path, mtime, size) -> StatsOutput, so that the stats file of one einsum
+    #  is parsed only once even if it is loaded from several places.
+    _loaded: Dict[Tuple[str, int, int], "StatsOutput"] = {}
+    #  Stats are loaded from the threads of Session.map.
+    _loaded_lock = threading.RLock()
 
     def __init__(self, file: Union[str, Path]):
         self.file = file
+        self._lines: List[str] = None
+        self._levels: Dict[str, LevelStats] = None
+        self._is_2d: bool = None
+        self._str_cache: Dict[Tuple[str, ...], str] = {}
 
     @staticmethod
     def load_from_outdir(outdir: Union[str, Path]) -> "StatsOutput":
@@ -15,14 +40,104 @@ class StatsOutput:
 
     @classmethod
     def load_from_file(cls, file: Union[str, Path]) -> "StatsOutput":
-        return cls(file)
+        try:
+            st = os.stat(file)
+        except OSError:
+            return cls(file)
+        key = (str(Path(file).resolve()), st.st_mtime_ns, st.st_size)
+        with cls._loaded_lock:
+            stats = cls._loaded.get(key)
+            if stats is None:
+                if len(cls._loaded) >= 256:
+                    cls._loaded.clear()
+                stats = cls._loaded[key] = cls(file)
+        return stats
+
+    def parse(self):
+        """Read the stats file once and split it into levels.
+
+        Every level starts with a "=== <name> ===" line and ends at the next
+        line starting with "===". Only the first level with a given name is
+        kept, which is the one the accessors below have always used.
+        Loaded stats are shared between threads, so `_lines` is only set once
+        the levels are complete.
+        """
+        if self._lines is not None:
+            return
 
-    def is_2d(self) -> bool:
         with open(self.file, "r") as f:
-            for line in f:
-                if "PE_col" in line:
-                    return True
-        return False
+            raw = f.read()
+
+        lines = [line.strip() for line in raw.splitlines()]
+        levels: Dict[str, LevelStats] = {}
+
+        level: LevelStats = None
+        dataspace = None
+        _reads = None
+        _fills = None
+        _updates = None
+        for line in lines:
+            if line.startswith("==="):
+                level = None
+                name = line.strip("= ")
+                if name not in levels:
+                    level = LevelStats(name)
+                    levels[name] = level
+                dataspace = None
+                _reads = _fills = _updates = None
+                continue
+            if level is None:
+                continue
+            level.lines.append(line)
+
+            if line.endswith(":") and " " not in line:
+                dataspace = line[:-1]
+                continue
+
+            def _read_int():
+                i = line.index(":")
+                return int(line[i+2:])
+            if line.startswith("Scalar reads"):
+                _reads = _read_int()
+            if line.startswith("Scalar fills"):
+                _fills = _read_int()
+            if line.startswith("Scalar updates"):
+                _updates = _read_int()
+            if _reads is not None and _fills is not None and _updates is not None:
+                level.dataspaces.append(DataspaceStats(dataspace, _reads, _fills, _updates))
+                _reads = _fills = _updates = None
+
+        self._is_2d = "PE_col" in raw
+        self._levels = levels
+        self._lines = lines
+
+    def get_level(self, level: str) -> Union[LevelStats, None]:
+        self.parse()
+        return self._levels.get(level)
+
+    def get_levels(self) -> Dict[str, LevelStats]:
+        self.parse()
+        return self._levels
+
+    def get_dataspace_traffic(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """Scalar reads, fills and updates of each dataspace at each storage level.
+
+        Returns:
+            Dict[str, Dict[str, Dict[str, int]]]: e.g.,
+                {"L3": {"Q": {"reads": 8, "fills": 8, "updates": 0}, ...}, ...}
+        """
+        rst = {}
+        for name, level in self.get_levels().items():
+            if len(level.dataspaces) == 0:
+                continue
+            rst[name] = {}
+            for ds in level.dataspaces:
+                rst[name][ds.name] = {"reads": ds.reads, "fills": ds.fills, "updates": ds.updates}
+        return rst
+
+    def is_2d(self) -> bool:
+        self.parse()
+        return self._is_2d
 
     def get_energy(self) -> float:
         energy = self.read_str(["=== mac ===", "Energy"])
@@ -104,16 +219,20 @@ class StatsOutput:
         return int(rst)
 
     def read_str(self, prefixes: List[str]) -> str:
-        with open(self.file, "r") as f:
-            line = f.readline().strip()
-            for prefix in prefixes:
-                while line[:len(prefix)] != prefix:
-                    line = f.readline()
-                    if line == "":
-                        break
-                    line = line.strip()
+        key = tuple(prefixes)
+        if key in self._str_cache:
+            return self._str_cache[key]
+
+        self.parse()
+        n = 0
+        for prefix in prefixes:
+            while n < len(self._lines) and not self._lines[n].startswith(prefix):
+                n += 1
+        line = self._lines[n] if n < len(self._lines) else ""
         i = line.index(":")
-        return line[i+2:]
+        rst = line[i+2:]
+        self._str_cache[key] = rst
+        return rst
 
     def read_scalar_reads(self, name: str) -> int:
         return self.read_scalar(name, "reads")
@@ -125,26 +244,16 @@ class StatsOutput:
         return self.read_scalar(name, "fills")
 
     def read_scalar(self, name: str, scalar: str) -> int:
-        STATE_WAIT = 0
-        STATE_CATCH = 1
+        level = self.get_level(name)
+        if level is None:
+            return 0
 
-        state = STATE_WAIT
-        name = f"=== {name} ==="
         scalar = f"Scalar {scalar}"
         rst = 0
-        with open(self.file, "r") as f:
-            for line in f:
-                line = line.strip()
-                if state == STATE_WAIT:
-                    if line.startswith(name):
-                        state = STATE_CATCH
-                        continue
-                if state == STATE_CATCH:
-                    if line.startswith(scalar):
-                        i = line.index(":")
-                        rst += int(line[i+2:])
-                    if line.startswith("==="):
-                        break
+        for line in level.lines:
+            if line.startswith(scalar):
+                i = line.index(":")
+                rst += int(line[i+2:])
         return rst
 
     def read_scalar_rfu (self, level: str) -> Tuple[int, int, int]:
@@ -156,44 +265,18 @@ class StatsOutput:
         Returns:
             Tuple[int, int]: (scalar reads, scalar fills, scalar updates).
         """
-        STATE_WAIT = 0
-        STATE_CATCH = 1
+        _level = self.get_level(level)
+        if _level is None:
+            return (0, 0, 0)
 
-        state = STATE_WAIT
-        name = f"=== {level} ==="
         scalar_reads = 0
         scalar_fills = 0
         scalar_updates = 0
-        with open(self.file, "r") as f:
-            _reads = None
-            _fills = None
-            _updates = None
-            for line in f:
-                line = line.strip()
-                if state == STATE_WAIT:
-                    if line.startswith(name):
-                        state = STATE_CATCH
-                        continue
-                if state == STATE_CATCH:
-                    def _read_int():
-                        i = line.index(":")
-                        return int(line[i+2:])
-                    if line.startswith("Scalar reads"):
-                        _reads = _read_int()
-                    if line.startswith("Scalar fills"):
-                        _fills = _read_int()
-                    if line.startswith("Scalar updates"):
-                        _updates = _read_int()
-                    if _reads is not None and _fills is not None and _updates is not None:
-                        if _reads != _updates or level != "DRAM":
-                            scalar_reads += _reads
-                        scalar_fills += _fills
-                        scalar_updates += _updates
-                        _reads = None
-                        _fills = None
-                        _updates = None
-                    if line.startswith("==="):
-                        break
+        for ds in _level.dataspaces:
+            if ds.reads != ds.updates or level != "DRAM":
+                scalar_reads += ds.reads
+            scalar_fills += ds.fills
+            scalar_updates += ds.updates
         return (scalar_reads, scalar_fills, scalar_updates)
 
     def read_mac_utilized_instances(self) -> int:
@@ -1,5 +1,5 @@
 from baseline import *
-from results.results_io import write_results
+from results.results_io import write_results, has_results
 from config.arch import ArchConfig, ARCH_CLOUD, ARCH_EDGE
 from einsum.core import MHA_EINSUMS, ANORM_EINSUMS, QKV_EINSUMS, FFN_EINSUMS
 from pathlib import Path
@@ -7,9 +7,15 @@ from itertools import product
 from pipeline.search_factor2 import get_all_candidates
 from pipeline.mcts import MCTS
 from pipeline.instance import get_instance
-from dataclasses import asdict
+from dataclasses import dataclass, asdict
 from pipeline.core import TransFusion, TransFusionOptions
 from results.figure2 import plot_results
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Union
+import argparse
+import traceback
+import json
+import os
 
 def run_baseline(baseline: Baseline, opts: BaselineOptions):
     if isinstance(opts, FusedBaselineOptions):
@@ -25,12 +31,39 @@ def run_baseline(baseline: Baseline, opts: BaselineOptions):
     )
     write_results(name, opts, outp)
 
-def MCTS_search(arch_config: ArchConfig, model: str, seq_len: str):
+def MCTS_search(
+    arch_config: ArchConfig,
+    model: str,
+    seq_len: str,
+    workers: int = 1,
+    time_budget: Union[float, None] = None,
+    patience: Union[int, None] = None,
+    resume: bool = True,
+    screen_top_k: Union[int, None] = None,
+    objective: str = "energy",
+    latency_weight: float = 0.5
+):
     print(f"Running TransFusion: {arch_config.name}, {model}, {seq_len} ...")
+    base_dir = Path(__file__).parent
+    outdir = base_dir/"outs"/arch_config.name/model/seq_len/"TransFusion"
+    checkpoint = outdir/"mcts-checkpoint.json"
+    if not resume:
+        checkpoint.unlink(missing_ok=True)
     instances = asdict(get_instance(model, seq_len, arch_config.mesh_2d))
     candidates = get_all_candidates(arch_config, instances)
-    mcts = MCTS(candidates, arch_config, model, seq_len)
-    factors = mcts.search(20)
+    mcts = MCTS(
+        candidates, arch_config, model, seq_len, screen_top_k=screen_top_k,
+        objective=objective, latency_weight=latency_weight)
+    rst = mcts.search(20, workers, time_budget, patience, checkpoint=checkpoint)
+
+    factors = rst
+    if objective == "pareto":
+        #  The front goes next to the outputs, the results are of its point of
+        #  the lowest cost.
+        outdir.mkdir(parents=True, exist_ok=True)
+        with open(outdir/"pareto.json", "w") as f:
+            json.dump({"latency_weight": latency_weight, "front": rst}, f, indent=4)
+        factors = mcts.best_factors
 
     inp = TransFusionOptions(
         model,
@@ -39,33 +72,138 @@ def MCTS_search(arch_config: ArchConfig, model: str, seq_len: str):
     )
 
     transfusion = TransFusion(inp)
-
-    base_dir = Path(__file__).parent
-    outp = transfusion.eval_transformer(factors, base_dir/"outs"/arch_config.name/model/seq_len/"TransFusion")
+    outp = transfusion.eval_transformer(factors, outdir)
 
     write_results("TransFusion", inp, outp)
 
+@dataclass(frozen=True)
+class SweepJob:
+    name: str
+    opts: Union[BaselineOptions, TransFusionOptions]
+    baseline_class: Union[type, None] = None  #  None for the TransFusion search.
+    mcts_workers: int = 1
+    mcts_time_budget: Union[float, None] = None
+    mcts_patience: Union[int, None] = None
+    mcts_screen_top_k: Union[int, None] = None
+    mcts_objective: str = "energy"
+    mcts_latency_weight: float = 0.5
 
-def main():
-    models = ["BERT", "TrXL", "T5", "XLM", "Llama3"]
-    seq_lens = ["1K", "4K", "16K", "64K", "256K", "1M"]
-    arch_configs = [ARCH_EDGE, ARCH_CLOUD]
+    def __str__(self):
+        return f"{self.name}: {self.opts.arch_config.name}, {self.opts.model}, {self.opts.seq_len}"
+
+def build_jobs(
+    arch_configs: List[ArchConfig],
+    models: List[str],
+    seq_lens: List[str],
+    mcts_workers: int = 1,
+    mcts_time_budget: Union[float, None] = None,
+    mcts_patience: Union[int, None] = None,
+    mcts_screen_top_k: Union[int, None] = None,
+    mcts_objective: str = "energy",
+    mcts_latency_weight: float = 0.5
+) -> List[SweepJob]:
     baseline_class = [Unfused]
     fused_baseline_class = [FuseMax, Flat, FFN, LayerNorm, QKV, Softmax]
+    jobs = []
     for arch_config, model, seq_len in product(arch_configs, models, seq_lens):
         for b_class in baseline_class:
             opts = BaselineOptions(model, seq_len, arch_config)
-            baseline = b_class(opts)
-            run_baseline(baseline, opts)
+            jobs.append(SweepJob(b_class.__name__, opts, b_class))
 
         for b_class, fused in product(fused_baseline_class, [True, False]):
             opts = FusedBaselineOptions(model, seq_len, arch_config, fused)
-            baseline = b_class(opts)
-            run_baseline(baseline, opts)
+            jobs.append(SweepJob(f"{b_class.__name__}_{'Fused' if fused else 'Unfused'}", opts, b_class))
+
+        jobs.append(SweepJob(
+            "TransFusion", TransFusionOptions(model, seq_len, arch_config),
+            mcts_workers=mcts_workers, mcts_time_budget=mcts_time_budget, mcts_patience=mcts_patience,
+            mcts_screen_top_k=mcts_screen_top_k, mcts_objective=mcts_objective,
+            mcts_latency_weight=mcts_latency_weight))
+    return jobs
+
+def run_job(job: SweepJob, force: bool = False):
+    if job.baseline_class is None:
+        #  A forced rerun does not resume an interrupted search.
+        MCTS_search(
+            job.opts.arch_config, job.opts.model, job.opts.seq_len,
+            job.mcts_workers, job.mcts_time_budget, job.mcts_patience, resume=not force,
+            screen_top_k=job.mcts_screen_top_k, objective=job.mcts_objective,
+            latency_weight=job.mcts_latency_weight)
+    else:
+        run_baseline(job.baseline_class(job.opts), job.opts)
+
+def run_sweep(jobs: List[SweepJob], workers: int = 1, force: bool = False) -> List[dict]:
+    """Run the jobs on a process pool.
+
+    Jobs whose results already exist for the same inputs are skipped unless
+    `force`. A failed job is recorded and does not stop the others.
+
+    Returns:
+        List[dict]: The failed jobs and their tracebacks.
+    """
+    pending = [job for job in jobs if force or not has_results(job.name, job.opts)]
+    print(f"Sweep: {len(pending)} of {len(jobs)} jobs to run, {workers} workers.")
+
+    failures = []
+    if workers <= 1:
+        for job in pending:
+            try:
+                run_job(job, force)
+            except Exception:
+                failures.append({"job": str(job), "error": traceback.format_exc()})
+                print(f"Failed {job}.")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_job, job, force): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                    print(f"Finished {job}.")
+                except Exception:
+                    failures.append({"job": str(job), "error": traceback.format_exc()})
+                    print(f"Failed {job}.")
+
+    failures_file = Path(__file__).parent / "outs" / "sweep-failures.json"
+    failures_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(failures_file, "w") as f:
+        json.dump(failures, f, indent=4)
+    return failures
+
+def main(
+    workers: int = 1,
+    force: bool = False,
+    mcts_workers: int = 1,
+    mcts_time_budget: Union[float, None] = None,
+    mcts_patience: Union[int, None] = None,
+    mcts_screen_top_k: Union[int, None] = None,
+    mcts_objective: str = "energy",
+    mcts_latency_weight: float = 0.5
+):
+    models = ["BERT", "TrXL", "T5", "XLM", "Llama3"]
+    seq_lens = ["1K", "4K", "16K", "64K", "256K", "1M"]
+    arch_configs = [ARCH_EDGE, ARCH_CLOUD]
 
-        MCTS_search(arch_config, model, seq_len)
+    jobs = build_jobs(arch_configs, models, seq_lens, mcts_workers, mcts_time_budget, mcts_patience, mcts_screen_top_k,
+        mcts_objective, mcts_latency_weight)
+    failures = run_sweep(jobs, workers, force)
+    if len(failures) != 0:
+        print(f"{len(failures)} jobs failed, see outs/sweep-failures.json. Skip plotting.")
+        return
 
     plot_results()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="The number of worker processes.")
+    parser.add_argument("--force", action="store_true", help="Rerun the jobs that already have results.")
+    parser.add_argument("--mcts-workers", type=int, default=1, help="The number of leaves each MCTS search evaluates at once.")
+    parser.add_argument("--mcts-time-budget", type=float, default=None, help="The seconds after which each MCTS search stops.")
+    parser.add_argument("--mcts-patience", type=int, default=None, help="Stop each MCTS search after this many iterations without improvement.")
+    parser.add_argument("--mcts-screen-top-k", type=int, default=None, help="The unvisited candidates each MCTS round may send to the full evaluation, by analytical estimate.")
+    parser.add_argument("--mcts-objective", choices=["energy", "pareto"], default="energy", help="What each MCTS search minimizes, \"pareto\" also writes the (latency, energy) front to pareto.json.")
+    parser.add_argument("--mcts-latency-weight", type=float, default=0.5, help="The weight of the latency in the \"pareto\" MCTS cost.")
+    args = parser.parse_args()
+    main(
+        args.workers, args.force, args.mcts_workers, args.mcts_time_budget, args.mcts_patience, args.mcts_screen_top_k,
+        args.mcts_objective, args.mcts_latency_weight)
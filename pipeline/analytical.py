@@ -0,0 +1,103 @@
+from dataclasses import asdict
+from typing import Dict, List, Tuple
+import numpy as np
+from config.arch import ArchConfig
+from einsum.core import Einsum, Einsums, QKV_EINSUMS, MHA_EINSUMS, ANORM_EINSUMS, load_ffn_einsums_for_model
+from pipeline.instance import Instance
+from pipeline.session import search_scheduler
+from pipeline.candidates import CandidateSet
+from pipeline.search_factor2 import L3_DIMS
+from results.model import MODEL_FUNC
+
+class AnalyticalModel:
+    """Fast estimate of the latency, DRAM traffic and energy of factors.
+
+    The compute latency of each einsum group is the one of its analytical
+    schedule (see `search_scheduler`), which does not depend on the factors.
+    The DRAM traffic counts the tensors that enter or leave the group: each
+    is moved once per iteration of the DRAM loops over the dimensions it
+    does not have. The L3 traffic likewise counts the operands of every einsum
+    over the DRAM loops. A group takes the max of its compute and DRAM
+    latency and the groups are added up with MODEL_FUNC, as in
+    `eval_transformer`. Energy uses the access widths of
+    `StatsOutput.estimate_traffic_energy_eachlevel`.
+    """
+    def __init__(self, arch_config: ArchConfig, model: str, seq_len: str):
+        self.arch_config = arch_config
+        self.model = model
+        self.seq_len = seq_len
+        instance = Instance.load_model_instance(model, seq_len, arch_config.mesh_2d)
+        _instance = asdict(instance)
+
+        self.groups: List[Einsums] = [QKV_EINSUMS, MHA_EINSUMS, ANORM_EINSUMS, load_ffn_einsums_for_model(model)]
+        self.comp_latency: Dict[str, float] = {}
+        self.compute_count: Dict[str, int] = {}
+        #  The sizes of the DRAM and of the L3 tensors of each group, and their
+        #  tensor x dim masks, 1 if the tensor does not have the dim.
+        self.dram_sizes: Dict[str, np.ndarray] = {}
+        self.dram_masks: Dict[str, np.ndarray] = {}
+        self.l3_sizes: Dict[str, np.ndarray] = {}
+        self.l3_masks: Dict[str, np.ndarray] = {}
+        for einsums in self.groups:
+            sch_rst = search_scheduler(
+                model, seq_len, einsums, arch_config,
+                MHA_Improve_H=min(arch_config.mesh_2d, instance.H, 4))
+            self.comp_latency[einsums.name] = sch_rst.latency
+            self.compute_count[einsums.name] = sum([
+                Einsum.load_from_einsums(name, einsums).get_compute_count(_instance)
+                for name in einsums.names
+            ])
+
+            dram_tensors = []
+            for tensor in einsums.block_inputs + einsums.global_parameters + einsums.block_outputs:
+                #  Outputs of a group may be named after the tensors of the next one.
+                if tensor in einsums.dimensions and tensor not in dram_tensors:
+                    dram_tensors.append(tensor)
+            l3_tensors = []
+            for name in einsums.names:
+                l3_tensors += [name] + einsums.inputs[name]
+
+            self.dram_sizes[einsums.name], self.dram_masks[einsums.name] = \
+                self.get_tensors(einsums, dram_tensors, _instance)
+            self.l3_sizes[einsums.name], self.l3_masks[einsums.name] = \
+                self.get_tensors(einsums, l3_tensors, _instance)
+
+    @staticmethod
+    def get_tensors(einsums: Einsums, tensors: List[str], instance: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        sizes = []
+        for tensor in tensors:
+            size = 1
+            for d in einsums.dimensions[tensor]:
+                size *= instance[d]
+            sizes.append(size)
+        masks = [[d not in einsums.dimensions[tensor] for d in L3_DIMS] for tensor in tensors]
+        return np.array(sizes, dtype=np.float64), np.array(masks, dtype=np.float64).reshape(len(tensors), len(L3_DIMS))
+
+    def evaluate(self, candidates: CandidateSet) -> Dict[str, np.ndarray]:
+        """The estimated "latency", "energy" and "dram_traffic" (bytes) of every candidate.
+        """
+        log_dram = np.log2(np.stack([candidates.get_column("DRAM", dim) for dim in L3_DIMS], axis=1).astype(np.float64))
+        bandwidth = self.arch_config.bandwidth * (2**30)
+        dram_energy = self.arch_config.dram_energy
+        global_buffer_energy = self.arch_config.global_buffer_energy
+        reg_file_energy = self.arch_config.reg_file_energy
+
+        latency = {}
+        energy = {}
+        traffic = {}
+        for einsums in self.groups:
+            name = einsums.name
+            dram_words = np.exp2(log_dram @ self.dram_masks[name].T) @ self.dram_sizes[name]
+            l3_words = np.exp2(log_dram @ self.l3_masks[name].T) @ self.l3_sizes[name]
+            traffic[name] = dram_words * 2  #  16-bit
+            latency[name] = np.maximum(self.comp_latency[name], traffic[name] / bandwidth)
+            energy[name] = dram_words / 4 * dram_energy.read + \
+                l3_words / 256 * global_buffer_energy.read + \
+                self.compute_count[name] * (2 * reg_file_energy.read + reg_file_energy.write)
+
+        mod_func = MODEL_FUNC[self.model]
+        return {
+            "latency": mod_func(latency["QKV"], latency["MHA"], latency["LayerNorm"], latency["FFN"]),
+            "energy": mod_func(energy["QKV"], energy["MHA"], energy["LayerNorm"], energy["FFN"]),
+            "dram_traffic": mod_func(traffic["QKV"], traffic["MHA"], traffic["LayerNorm"], traffic["FFN"])
+        }
@@ -0,0 +1,246 @@
+from pathlib import Path
+from typing import Union, List, Dict
+from collections import OrderedDict
+from dataclasses import asdict
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io_config.yaml_input import YamlInput, YamlConstructor
+from io_config.stats import StatsOutput
+from engine.timeloop import COMPONENTS_DIR
+from config.arch import ArchConfig, PE
+from einsum.einsums import Einsums
+from pipeline.scheduler import Schedule, ScheduleResult, SCHEDULER_VERSION
+
+STATS_FILE = "timeloop-model.stats.txt"
+
+def canonical_input(obj) -> object:
+    """Convert a (possibly tagged) yaml input into plain, json-serializable data.
+    """
+    if isinstance(obj, YamlConstructor):
+        return {"!tag": obj.yaml_tag, **{k: canonical_input(v) for k, v in obj.__dict__.items()}}
+    if isinstance(obj, dict):
+        return {str(k): canonical_input(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [canonical_input(v) for v in obj]
+    return obj
+
+def components_version() -> str:
+    """Hash of the component library passed to every Timeloop run.
+    """
+    global _components_version
+    if _components_version is None:
+        h = hashlib.sha256()
+        for file in sorted(COMPONENTS_DIR.iterdir()):
+            h.update(file.name.encode())
+            h.update(file.read_bytes())
+        _components_version = h.hexdigest()
+    return _components_version
+
+_components_version = None
+
+class TimeloopCache:
+    """Content-addressed on-disk cache of Timeloop model runs.
+
+    An entry is keyed by the canonical hash of the arch, mapping and problem
+    inputs plus the version of the component library, and stores the
+    timeloop-model.stats.txt of that run. Entries are evicted in LRU order
+    once the cache grows over `max_bytes`.
+    """
+    def __init__(
+        self,
+        cache_dir: Union[str, Path] = Path(__file__).parent / "tl_cache",
+        max_bytes: int = 4 * (2**30)
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index: "OrderedDict[str, int]" = None
+        #  Sessions evaluate einsums on threads, see Session.map.
+        self._lock = threading.RLock()
+
+    def get_key(self, inputs: List[YamlInput]) -> str:
+        data = {}
+        for inp in inputs:
+            data.update(canonical_input(inp.input))
+        h = hashlib.sha256()
+        h.update(json.dumps(data, sort_keys=True).encode())
+        h.update(components_version().encode())
+        return h.hexdigest()
+
+    def get_entry(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def load_index(self) -> "OrderedDict[str, int]":
+        if self._index is not None:
+            return self._index
+
+        entries = []
+        if self.cache_dir.exists():
+            for entry in self.cache_dir.glob(f"*/*/{STATS_FILE}"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, entry.parent.name, st.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        return self._index
+
+    def get(self, key: str, outdir: Union[str, Path]) -> Union[StatsOutput, None]:
+        """Restore the stats of a cached run into `outdir`.
+
+        Returns:
+            Union[StatsOutput, None]: The stats, or None on a cache miss.
+        """
+        stats_file = self.get_entry(key) / STATS_FILE
+        if not stats_file.exists():
+            with self._lock:
+                self.misses += 1
+            return None
+
+        outdir = Path(outdir)
+        outdir.mkdir(parents=True, exist_ok=True)
+        try:
+            shutil.copyfile(stats_file, outdir / STATS_FILE)
+            os.utime(stats_file)
+        except FileNotFoundError:
+            #  Evicted by another process in the meantime.
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            index = self.load_index()
+            if key in index:
+                index.move_to_end(key)
+            self.hits += 1
+        return StatsOutput.load_from_outdir(outdir)
+
+    def put(self, key: str, outdir: Union[str, Path]):
+        """Store the stats of a finished run in `outdir` under `key`.
+        """
+        src = Path(outdir) / STATS_FILE
+        if not src.exists():
+            return
+
+        entry = self.get_entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=entry.parent, prefix=".tmp-"))
+        try:
+            shutil.copyfile(src, tmp_dir / STATS_FILE)
+            os.replace(tmp_dir, entry)
+        except OSError:
+            #  Already stored by another process.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        with self._lock:
+            index = self.load_index()
+            index[key] = (entry / STATS_FILE).stat().st_size
+            index.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            index = self.load_index()
+            total = sum(index.values())
+            while total > self.max_bytes and len(index) > 1:
+                key, size = index.popitem(last=False)
+                shutil.rmtree(self.get_entry(key), ignore_errors=True)
+                total -= size
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+TIMELOOP_CACHE = TimeloopCache()
+
+def dump_schedule_result(sch_rst: ScheduleResult) -> dict:
+    return {
+        "schedules": {
+            ein: [sch.einsum, sch.pe.value, sch.start_time, sch.end_time]
+            for ein, sch in sch_rst.schedules.items()
+        },
+        "latency": sch_rst.latency,
+        "dag": sch_rst.dag,
+        "lower_bound": sch_rst.lower_bound
+    }
+
+def load_schedule_result(data: dict) -> ScheduleResult:
+    return ScheduleResult(
+        schedules={
+            ein: Schedule(einsum=d[0], pe=PE(d[1]), start_time=d[2], end_time=d[3])
+            for ein, d in data["schedules"].items()
+        },
+        latency=data["latency"],
+        dag=data["dag"],
+        lower_bound=data["lower_bound"]
+    )
+
+class ScheduleCache:
+    """Process-wide and on-disk cache of `search_scheduler` results.
+
+    A schedule only depends on the model, seq_len, einsum group, arch,
+    MHA_Improve_H and the scheduler mode and time budget, so it is searched once per configuration and shared by
+    every TransFusion object and every process of a sweep.
+    """
+    def __init__(self, cache_dir: Union[str, Path] = Path(__file__).parent / "sch_cache"):
+        self.cache_dir = Path(cache_dir)
+        self._results: Dict[str, ScheduleResult] = {}
+        self._lock = threading.RLock()
+
+    def get_key(
+        self,
+        model: str,
+        seq_len: str,
+        einsums: Einsums,
+        arch_config: ArchConfig,
+        MHA_Improve_H: int,
+        mode: str = "exact",
+        time_budget: Union[float, None] = None
+    ) -> str:
+        data = {
+            "model": model,
+            "seq_len": seq_len,
+            "einsums": asdict(einsums),
+            "arch": asdict(arch_config),
+            "MHA_Improve_H": MHA_Improve_H,
+            "mode": mode,
+            "time_budget": time_budget,
+            "version": SCHEDULER_VERSION
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def get_entry(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Union[ScheduleResult, None]:
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+
+        try:
+            with open(self.get_entry(key), "r") as f:
+                sch_rst = load_schedule_result(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+        with self._lock:
+            self._results[key] = sch_rst
+        return sch_rst
+
+    def put(self, key: str, sch_rst: ScheduleResult):
+        with self._lock:
+            self._results[key] = sch_rst
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(dump_schedule_result(sch_rst), f)
+        os.replace(tmp_file, self.get_entry(key))
+
+SCHEDULE_CACHE = ScheduleCache()
@@ -0,0 +1,58 @@
+from typing import Dict, List, Iterator, Union
+import numpy as np
+
+class CandidateSet:
+    """Factor candidates stored as one integer matrix over (candidate, level, dim).
+
+    It behaves like the list of `{"DRAM": {...}, "L3": {...}, "PE": {...}}`
+    dicts it replaces: `len`, indexing and iteration return those dicts, so
+    `random.choice` and the callers of `get_all_candidates` keep working,
+    while the factors themselves take about a hundred bytes per candidate.
+    """
+    def __init__(self, levels: List[str], dims: List[str], data: np.ndarray):
+        self.levels = list(levels)
+        self.dims = list(dims)
+        data = np.asarray(data, dtype=np.int32)
+        self.data = data.reshape(len(data), len(self.levels), len(self.dims))
+        self._index: Dict[bytes, int] = None
+
+    @classmethod
+    def from_factors(cls, candidates: List[Dict[str, Dict[str, int]]]) -> "CandidateSet":
+        if len(candidates) == 0:
+            return cls([], [], np.zeros((0, 0, 0)))
+        levels = list(candidates[0].keys())
+        dims = list(candidates[0][levels[0]].keys())
+        data = [[[factors[level][dim] for dim in dims] for level in levels] for factors in candidates]
+        return cls(levels, dims, np.array(data))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, i: int) -> Dict[str, Dict[str, int]]:
+        row = self.data[i].tolist()
+        return {level: dict(zip(self.dims, vals)) for level, vals in zip(self.levels, row)}
+
+    def __iter__(self) -> Iterator[Dict[str, Dict[str, int]]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_column(self, level: str, dim: str) -> np.ndarray:
+        return self.data[:, self.levels.index(level), self.dims.index(dim)]
+
+    def get_key(self, i: int) -> bytes:
+        """A hashable key of the factors of candidate i.
+        """
+        return self.data[i].tobytes()
+
+    def index(self, factors: Dict[str, Dict[str, int]]) -> Union[int, None]:
+        """The row of the given factors, or None if they are not a candidate.
+        """
+        if self._index is None:
+            self._index = {}
+            for i in range(len(self)):
+                self._index.setdefault(self.get_key(i), i)
+        try:
+            row = np.array([[factors[level][dim] for dim in self.dims] for level in self.levels], dtype=np.int32)
+        except KeyError:
+            return None
+        return self._index.get(row.tobytes())
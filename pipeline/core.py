@@ -1,17 +1,19 @@
 from config.arch import PE as PE
 from dataclasses import dataclass, asdict
 from config.arch import ArchConfig
-from typing import Dict, List
+from typing import Dict, List, Tuple, Union
 from pipeline.session import SessionOutput, Session, SessionInput, search_scheduler, TimeloopResult
 from pipeline.instance import Instance
 from einsum.core import Einsums, QKV_EINSUMS, MHA_EINSUMS, ANORM_EINSUMS, FFN_EINSUMS, load_ffn_einsums_for_model, Einsum
-from pipeline.scheduler import ScheduleResult, run_scheduler, run_scheduler2, Schedule
+from pipeline.scheduler import ScheduleResult, run_scheduler, run_scheduler2, Schedule, pipeline_groups
 from pathlib import Path
-from functools import reduce
+from pipeline.factorize import get_divisors, get_divisor_set
 from itertools import product
+from collections import OrderedDict
+import threading
 from io_config.accelergy_input import AccelergyInput
 from pipeline.search_factor2 import random_factors
-from results.model import MODEL_FUNC
+from results.model import MODEL_FUNC, MODEL_GROUPS
 
 @dataclass(frozen=True)
 class TransFusionOptions:
@@ -33,8 +35,18 @@ class TransFusionTransformerOutputs:
     energy: float
     factors: Dict[str, Dict[str, int]]
     einsums_outputs: Dict[str, TransFusionOutputs]
+    #  With the groups overlapped, see pipeline_groups. None for results from
+    #  before it was recorded.
+    pipelined_latency: Union[float, None] = None
 
 class TransFusion:
+    #  Per-einsum results shared by all the TransFusion objects of the process,
+    #  keyed by `get_einsum_key` and evicted in LRU order past
+    #  `max_einsum_rsts`. Sessions evaluate einsums on threads, see Session.map.
+    einsum_rsts: "OrderedDict[tuple, Tuple[TimeloopResult, AccelergyInput]]" = OrderedDict()
+    max_einsum_rsts: int = 1024
+    _einsum_rsts_lock = threading.RLock()
+
     def __init__(self, inps: TransFusionOptions):
         self.arch_config = inps.arch_config
         self.instance = Instance.load_model_instance(
@@ -49,18 +61,15 @@ class TransFusion:
         self.session = Session()
 
         self.schedules = {}
+        self.einsum_hits = 0  #  Einsums reused from einsum_rsts, reported by eval_transformer.
 
     def factors(self, n):
-        # Source:
-        # https://stackoverflow.com/questions/6800193/what-is-the-most-efficient-way-of-finding-all-the-factors-of-a-number-in-python
-        factors = list(reduce(list.__add__, ([i, n//i] for i in range(1, int(n**0.5) + 1) if n % i == 0)))
-        factors.sort(reverse=True)
-        return factors
+        return get_divisors(n)[::-1]
 
     def assign_HEF(self, H, E, M) -> Dict[str, int]:
-        factors_H = self.factors(H)
-        factors_E = self.factors(E)
-        factors_M = self.factors(M)
+        factors_H = get_divisors(H)[::-1]
+        factors_E = get_divisors(E)[::-1]
+        factors_M = get_divisor_set(M)
 
         rst_h = 1
         rst_e = 1
@@ -303,6 +312,31 @@ class TransFusion:
         rst["reg_file"] = {d: 1 for d in einsum.get_dimensions()}
         return rst
 
+    def get_einsum_key(
+        self,
+        einsum: Einsum,
+        pe: PE,
+        factors: Dict[str, Dict[str, int]],
+        schedules: Dict[str, Schedule]
+    ) -> tuple:
+        """The canonical inputs of one einsum evaluation.
+
+        Two candidates that only differ in dimensions the einsum does not use
+        project to the same factors, and thus to the same key.
+        """
+        _schedules = {ein: asdict(sch) for ein, sch in schedules.items()}
+        keep_bypass = einsum.get_keep_bypass_with_schedule([], [], _schedules)
+        return (
+            self.model,
+            self.seq_len,
+            self.arch_config,
+            einsum.einsums.name,
+            einsum.name,
+            pe,
+            tuple((level, tuple(sorted(facs.items()))) for level, facs in sorted(factors.items())),
+            tuple((level, tuple(kb["keep"]), tuple(kb["bypass"])) for level, kb in sorted(keep_bypass.items()))
+        )
+
     def eval_einsum(
         self,
         einsum: Einsum,
@@ -310,17 +344,34 @@ class TransFusion:
         factors: Dict[str, Dict[str, int]],
         outdir: Path,
         schedules: Dict[str, Schedule]
-    ) -> TimeloopResult:
+    ) -> Tuple[TimeloopResult, AccelergyInput]:
+        _factors = self.build_factors(einsum, pe, factors)
+        key = self.get_einsum_key(einsum, pe, _factors, schedules)
+        with TransFusion._einsum_rsts_lock:
+            rst = TransFusion.einsum_rsts.get(key)
+            if rst is not None:
+                TransFusion.einsum_rsts.move_to_end(key)
+                self.einsum_hits += 1
+        if rst is not None:
+            return rst
+
         outp: SessionOutput = self.session.eval_einsum(SessionInput(
             instance=self.instance,
             einsum=einsum,
             arch_config=self.arch_config,
             pe=pe,
-            factors=self.build_factors(einsum, pe, factors),
+            factors=_factors,
             outdir=outdir,
             schedules=schedules
         ))
-        return outp.tl_rst
+        acc_inp = AccelergyInput.load_from_tl_outdir(outdir, einsum.einsums.compute_cost[einsum.name])
+
+        with TransFusion._einsum_rsts_lock:
+            TransFusion.einsum_rsts[key] = (outp.tl_rst, acc_inp)
+            TransFusion.einsum_rsts.move_to_end(key)
+            while len(TransFusion.einsum_rsts) > TransFusion.max_einsum_rsts:
+                TransFusion.einsum_rsts.popitem(last=False)
+        return outp.tl_rst, acc_inp
 
     def eval_einsums(
         self,
@@ -338,27 +389,29 @@ class TransFusion:
             self.schedules[einsums.name] = sch_rst
             print("Finished searching.")
 
-        latency = {}
-        tl_rsts = {}
-        acc_inps = {}
-        for einsum in einsums.names:
-            print(f"Running {self.name} einsum {einsum} ...")
-            einsum = Einsum.load_from_einsums(einsum, einsums)
+        def eval_one(name: str):
+            print(f"Running {self.name} einsum {name} ...")
+            einsum = Einsum.load_from_einsums(name, einsums)
 
             einsum_outdir = outdir / einsum.name
             pe = sch_rst.schedules[einsum.name].pe
-            tl_rst = self.eval_einsum(einsum, pe, factors, einsum_outdir, sch_rst.schedules)
+            tl_rst, acc_inp = self.eval_einsum(einsum, pe, factors, einsum_outdir, sch_rst.schedules)
             print(f"Finished {self.name} einsum {einsum.name}.")
+            return einsum.name, pe, tl_rst, acc_inp
 
-            tl_rsts[einsum.name] = tl_rst
+        latency = {}
+        tl_rsts = {}
+        acc_inps = {}
+        for name, pe, tl_rst, acc_inp in self.session.map(eval_one, einsums.names):
+            tl_rsts[name] = tl_rst
             if pe == PE.ONE_D:
-                latency[einsum.name] = [max(tl_rst.comp_latency, tl_rst.mem_latency), float("inf")]
+                latency[name] = [max(tl_rst.comp_latency, tl_rst.mem_latency), float("inf")]
             elif pe == PE.TWO_D:
-                latency[einsum.name] = [float("inf"), max(tl_rst.comp_latency, tl_rst.mem_latency)]
+                latency[name] = [float("inf"), max(tl_rst.comp_latency, tl_rst.mem_latency)]
             else:
                 raise Exception(f"Invalid PE {pe}.")
 
-            acc_inps[einsum.name] = AccelergyInput.load_from_tl_outdir(einsum_outdir, einsum.einsums.compute_cost[einsum.name])
+            acc_inps[name] = acc_inp
 
         sch_rst = run_scheduler(latency, sch_rst.dag)
         total_latency = sch_rst.latency
@@ -383,10 +436,13 @@ class TransFusion:
         outdir: Path
     ) -> TransFusionTransformerOutputs:
         rst: Dict[str, TransFusionOutputs] = {}
+        self.einsum_hits = 0
         ffn_einsums = load_ffn_einsums_for_model(self.model)
         for einsums in [QKV_EINSUMS, MHA_EINSUMS, ANORM_EINSUMS, ffn_einsums]:
             acc_out = self.eval_einsums(einsums, factors, outdir/einsums.name)
             rst[einsums.name] = acc_out
+        if self.einsum_hits != 0:
+            print(f"Reused {self.einsum_hits} {self.name} einsums.")
 
         mod_func = MODEL_FUNC[self.model]
 
@@ -399,7 +455,8 @@ class TransFusion:
             latency=mod_func(rst["QKV"].latency, rst["MHA"].latency, rst["LayerNorm"].latency, rst["FFN"].latency),
             energy=mod_func(rst["QKV"].energy, rst["MHA"].energy, rst["LayerNorm"].energy, rst["FFN"].energy),
             factors=factors,
-            einsums_outputs=rst
+            einsums_outputs=rst,
+            pipelined_latency=pipeline_groups([rst[group].sch_rst for group in MODEL_GROUPS[self.model]])
         )
 
     def eval_transformer_with_random_factors(
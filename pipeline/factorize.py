@@ -0,0 +1,47 @@
+from functools import lru_cache
+from typing import FrozenSet, Tuple
+
+@lru_cache(maxsize=None)
+def prime_factors(n: int) -> Tuple[Tuple[int, int], ...]:
+    """The (prime, exponent) of n, by increasing prime.
+    """
+    if n < 1:
+        raise Exception(f"Cannot factorize {n}")
+    rst = []
+    p = 2
+    while p * p <= n:
+        if n % p == 0:
+            e = 0
+            while n % p == 0:
+                n //= p
+                e += 1
+            rst.append((p, e))
+        p += 1 if p == 2 else 2
+    if n > 1:
+        rst.append((n, 1))
+    return tuple(rst)
+
+@lru_cache(maxsize=None)
+def get_divisors(n: int) -> Tuple[int, ...]:
+    """The divisors of n, in increasing order.
+    """
+    divisors = [1]
+    for p, e in prime_factors(n):
+        divisors = [d * p**k for d in divisors for k in range(e + 1)]
+    return tuple(sorted(divisors))
+
+@lru_cache(maxsize=None)
+def get_divisor_set(n: int) -> FrozenSet[int]:
+    return frozenset(get_divisors(n))
+
+@lru_cache(maxsize=None)
+def get_splits(n: int, k: int) -> Tuple[Tuple[int, ...], ...]:
+    """All the ordered ways to split n into k factors, in lexicographic order.
+    """
+    if k == 1:
+        return ((n,),)
+    return tuple(
+        (d,) + split
+        for d in get_divisors(n)
+        for split in get_splits(n // d, k - 1)
+    )
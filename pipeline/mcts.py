@@ -3,6 +3,17 @@ import math
 from pipeline.pregenerate import Pregenerate, PregenerateInput
 from config.arch import ArchConfig
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pipeline.candidates import CandidateSet
+from pipeline.surrogate import Surrogate
+from pipeline.analytical import AnalyticalModel
+from pipeline.warm_start import get_warm_start
+import numpy as np
+import json
+import os
+import tempfile
+import time
 
 #  [B, D, M, P, S]
 class MCTS_Node:
@@ -11,23 +22,58 @@ class MCTS_Node:
         self.value = value
         self.parent: "MCTS_Node" = parent
         self.children = []
+        self._children: Dict[int, "MCTS_Node"] = {}  #  By value.
         self.visits = 0
         self.total_cost = 0
+        self.virtual_loss = 0  #  Evaluations in flight below the node.
+        self.prior = float("inf")  #  The best predicted cost below the node.
+        self.screened = 0  #  Leaves of the screen below the node, see MCTS.fill_screen.
+        self.index: int = None  #  The candidate of a leaf.
 
     def is_leaf(self):
         return len(self.children) == 0
 
+    def get_child(self, name: str, value: int) -> "MCTS_Node":
+        """The child with the value, added if it does not exist yet.
+        """
+        if value not in self._children:
+            node = MCTS_Node(name, value, self)
+            self.children.append(node)
+            self._children[value] = node
+        return self._children[value]
+
     def average_cost(self):
         return self.total_cost / self.visits if self.visits > 0 else float("inf")
 
-    def uct(self, exploration_weight=1.4):
-        if self.visits == 0:
+    def uct(self, exploration_weight=1.4, virtual_loss_cost=float("inf")):
+        #  Each evaluation in flight counts as a visit of cost virtual_loss_cost,
+        #  so that parallel selections spread over the tree.
+        visits = self.visits + self.virtual_loss
+        if visits == 0:
             return float("inf")
 
+        cost = self.total_cost
+        if self.virtual_loss != 0:
+            cost += self.virtual_loss * virtual_loss_cost
+        cost = cost / visits
+
         if self.parent == None:
-            return -self.average_cost()
+            return -cost
+
+        parent_visits = self.parent.visits + self.parent.virtual_loss
+        return -cost + exploration_weight * math.sqrt(math.log(parent_visits) / visits)
+
+    def add_virtual_loss(self, count: int):
+        self.virtual_loss += count
 
-        return -self.average_cost() + exploration_weight * math.sqrt(math.log(self.parent.visits) / self.visits)
+        if self.parent != None:
+            self.parent.add_virtual_loss(count)
+
+    def add_screened(self, count: int):
+        self.screened += count
+
+        if self.parent != None:
+            self.parent.add_screened(count)
 
     def backpropagate(self, cost):
         self.visits += 1
@@ -49,31 +95,197 @@ class MCTS_Root(MCTS_Node):
 class MCTS:
     def __init__(
         self,
-        candidates: List[Dict[str, Dict[str, int]]],
+        candidates: Union[CandidateSet, List[Dict[str, Dict[str, int]]]],
         arch_config: ArchConfig,
         model: str,
-        seq_len: str
+        seq_len: str,
+        use_surrogate: bool = True,
+        screen_top_k: Union[int, None] = None,
+        objective: str = "energy",
+        latency_weight: float = 0.5,
+        warm_start: bool = True
     ):
-        self.candidates = candidates
+        """
+        Args:
+            screen_top_k (Union[int, None]): Only let the search reach the evaluated leaves and
+                the screen_top_k best unvisited ones by analytical estimate, see `fill_screen`.
+            objective (str): "energy" to search for the lowest energy, or "pareto" to
+                also keep the Pareto front of (latency, energy), see `get_cost`.
+            latency_weight (float): The weight of the latency in the "pareto" cost.
+            warm_start (bool): Try first the candidates closest to the best factors of
+                the neighbouring (arch, model, seq_len), see `pipeline.warm_start`.
+        """
+        if objective not in ["energy", "pareto"]:
+            raise Exception(f"Unknown MCTS objective: {objective}")
+        if screen_top_k is not None and screen_top_k < 1:
+            raise Exception(f"MCTS screen_top_k must be positive: {screen_top_k}")
+        if not isinstance(candidates, CandidateSet):
+            candidates = CandidateSet.from_factors(candidates)
         self.root = MCTS_Root()
         self.pregenerate = Pregenerate()
         self.arch_config = arch_config
         self.model = model
         self.seq_len = seq_len
-        self.best_energy = float("inf")
+        self.objective = objective
+        self.latency_weight = latency_weight
+        self.best_cost = float("inf")
         self.best_leaf = None
         self.best_factors = None
+        self.worst_cost = float("-inf")
+        self.stale = 0  #  Iterations since the best cost last improved.
+        #  The non-dominated {"factors", "latency", "energy"} evaluated so far, by latency.
+        self.front: List[Dict[str, object]] = []
+
+        self.screen_top_k = screen_top_k
+        self.screen_order: deque = None  #  The leaves not screened yet, best first.
+        self.screened = 0
+        self.estimates = None
+        if screen_top_k is not None and len(candidates) != 0:
+            self.estimates = AnalyticalModel(arch_config, model, seq_len).evaluate(candidates)
+        self.candidates = candidates
+
+        for i in range(len(candidates)):
+            self.build_from_factors(i)
+        self.stale = 0
+
+        #  Unvisited children are tried in the order of the warm start
+        #  candidates, then of the surrogate predictions.
+        self.surrogate = None
+        self.predictions = None
+        priors = None
+        if use_surrogate and len(candidates) != 0:
+            self.surrogate = Surrogate.from_store(self.pregenerate.store, arch_config, model, seq_len)
+        if self.surrogate is not None:
+            self.predictions = self.surrogate.predict(candidates)
+            priors = self.get_cost(self.predictions[:, 0], self.predictions[:, 1])
+        elif self.estimates is not None:
+            priors = self.get_cost(self.estimates["latency"], self.estimates["energy"])
+
+        self.warm_start: List[int] = []
+        if warm_start:
+            self.warm_start = get_warm_start(
+                candidates, self.pregenerate.store, arch_config.name, model, seq_len, self.get_cost)
+        if len(self.warm_start) != 0:
+            priors = np.full(len(candidates), float("inf")) if priors is None else priors.copy()
+            #  Below any cost, in the order of the warm start.
+            for rank, index in enumerate(self.warm_start):
+                leaf_index = self.get_leaf(index).index
+                priors[leaf_index] = min(priors[leaf_index], rank - len(self.warm_start))
+        if priors is not None:
+            self.set_priors(self.root, priors)
+
+        if self.estimates is not None:
+            self.init_screen()
+
+    def init_screen(self):
+        """Rank the leaves for the screen, warm start candidates first.
 
-        for factors in candidates:
-            self.build_from_factors(factors)
+        The analytical cost ranks poorly at long seq_len and on edge, so with a
+        surrogate the leaves are ranked by the sum of both ranks.
+        """
+        leaves = np.array([i for i in range(len(self.candidates)) if self.get_leaf(i).index == i], dtype=np.int64)
+        ranks = np.argsort(np.argsort(
+            self.get_cost(self.estimates["latency"][leaves], self.estimates["energy"][leaves]), kind="stable"))
+        if self.predictions is not None:
+            ranks = ranks + np.argsort(np.argsort(
+                self.get_cost(self.predictions[leaves, 0], self.predictions[leaves, 1]), kind="stable"))
+        order = [int(i) for i in leaves[np.argsort(ranks, kind="stable")]]
+        warm_start = [self.get_leaf(index).index for index in self.warm_start]
+        self.screen_order = deque(warm_start + order)
+        self.fill_screen()
 
-    def update_best_leaf(self, factors: Dict[str, Dict[str, int]], leaf: MCTS_Node, energy: float):
-        if energy < self.best_energy:
-            self.best_energy = energy
+    def fill_screen(self):
+        """Screen the next unvisited leaves until screen_top_k of them are screened.
+
+        Unvisited leaves are only selected once screened, so each round of the
+        search expands among the screen_top_k best leaves not evaluated yet.
+        """
+        while self.screened < self.screen_top_k and len(self.screen_order) != 0:
+            leaf = self.get_leaf(self.screen_order.popleft())
+            if leaf.screened != 0 or leaf.visits + leaf.virtual_loss != 0:
+                continue
+            leaf.add_screened(1)
+            self.screened += 1
+
+    def take_screen(self, leaf: MCTS_Node):
+        """Replace a selected leaf of the screen with the next one.
+        """
+        if self.screen_order is None or leaf.screened == 0:
+            return
+        leaf.add_screened(-1)
+        self.screened -= 1
+        self.fill_screen()
+
+    def is_expandable(self, node: MCTS_Node) -> bool:
+        if self.screen_order is None:
+            return True
+        return node.visits + node.virtual_loss != 0 or node.screened != 0
+
+    def get_cost(self, latency, energy):
+        """The cost minimized by the search, of floats or arrays.
+
+        It is the energy, or for the "pareto" objective the weighted geometric
+        mean energy^(1 - w) * latency^w, which does not depend on the units or
+        on the results seen so far, so the costs backpropagated at different
+        iterations stay comparable. Every minimum of it is on the front.
+        """
+        if self.objective == "energy":
+            return energy
+        return energy**(1 - self.latency_weight) * latency**self.latency_weight
+
+    def update_best_leaf(self, factors: Dict[str, Dict[str, int]], leaf: MCTS_Node, rst: Dict[str, float]) -> float:
+        """Update the best leaf and the front with the result of a leaf.
+
+        Returns:
+            float: The cost of the result.
+        """
+        cost = self.get_cost(rst["latency"], rst["energy"])
+        self.worst_cost = max(self.worst_cost, cost)
+        if self.objective == "pareto":
+            self.update_front(factors, rst["latency"], rst["energy"])
+        if cost < self.best_cost:
+            self.best_cost = cost
             self.best_factors = factors
             self.best_leaf = leaf
+            self.stale = 0
+        else:
+            self.stale += 1
+        return cost
+
+    def update_front(self, factors: Dict[str, Dict[str, int]], latency: float, energy: float):
+        for point in self.front:
+            if point["latency"] <= latency and point["energy"] <= energy:
+                return
+        self.front = [
+            point for point in self.front
+            if not (latency <= point["latency"] and energy <= point["energy"])
+        ]
+        self.front.append({"factors": factors, "latency": latency, "energy": energy})
+        self.front.sort(key=lambda point: (point["latency"], point["energy"]))
 
-    def build_from_factors(self, factors: Dict[str, Dict[str, int]]) -> MCTS_Node:
+    def finish_iteration(self, leaf: MCTS_Node, factors: Dict[str, Dict[str, int]], rst: Dict[str, float]):
+        self.record_analytical(leaf, factors, rst)
+        cost = self.update_best_leaf(factors, leaf, rst)
+        leaf.backpropagate(cost)
+
+    def get_result(self):
+        """The best factors, or the front for the "pareto" objective.
+        """
+        if self.objective == "pareto":
+            return self.front
+        return self.best_factors
+
+    def should_stop(self, start: float, time_budget: Union[float, None], patience: Union[int, None]) -> bool:
+        if time_budget is not None and time.monotonic() - start >= time_budget:
+            print(f"MCTS Search stops after {time_budget}s.")
+            return True
+        if patience is not None and self.stale >= patience:
+            print(f"MCTS Search converged, no improvement in {self.stale} iterations.")
+            return True
+        return False
+
+    def build_from_factors(self, index: int) -> MCTS_Node:
+        factors = self.candidates[index]
         facs = {
             "B": factors["L3"]["B"],
             "D": factors["L3"]["D"],
@@ -82,46 +294,118 @@ class MCTS:
             "S": factors["L3"]["S"]
         }
 
+        #  Candidates with the same prefix of factors share the nodes of the
+        #  prefix, and so their statistics.
         parent: MCTS_Node = self.root
         for dim, val in facs.items():
-            node = MCTS_Node(dim, val, parent)
-            parent.children.append(node)
-            parent = node
+            parent = parent.get_child(dim, val)
+        parent.index = index
 
         pre_rst = self.pregenerate.read_from_file(self.arch_config, self.model, self.seq_len, factors)
         if pre_rst != None:
-            energy = pre_rst["energy"]
-            parent.backpropagate(energy)
-            self.update_best_leaf(factors, parent, energy)
+            cost = self.update_best_leaf(factors, parent, pre_rst)
+            parent.backpropagate(cost)
+
+    def set_priors(self, node: MCTS_Node, costs: np.ndarray) -> float:
+        if node.is_leaf():
+            node.prior = float(costs[node.index])
+        else:
+            node.prior = min(self.set_priors(child, costs) for child in node.children)
+        return node.prior
+
+    def record_prediction(self, leaf: MCTS_Node, factors: Dict[str, Dict[str, int]]):
+        """Store the surrogate prediction of a leaf about to be evaluated, to
+        calibrate it against the full evaluation.
+        """
+        store = self.pregenerate.store
+        if self.predictions is not None:
+            latency, energy = self.predictions[leaf.index]
+            store.insert_prediction(
+                self.arch_config.name, self.model, self.seq_len, factors, float(latency), float(energy))
+
+    def record_analytical(self, leaf: MCTS_Node, factors: Dict[str, Dict[str, int]], rst: Dict[str, float]):
+        """Store the analytical estimate of the leaf of a screened round together
+        with its full result.
+        """
+        if self.estimates is None:
+            return
+        latency = float(self.estimates["latency"][leaf.index])
+        energy = float(self.estimates["energy"][leaf.index])
+        print(f"MCTS Screen: analytical latency {latency}, energy {energy}; full latency {rst['latency']}, energy {rst['energy']}")
+        self.pregenerate.store.insert_analytical(
+            self.arch_config.name, self.model, self.seq_len, factors, latency, energy,
+            float(self.estimates["dram_traffic"][leaf.index]), rst["latency"], rst["energy"])
 
     def select(self):
         node: MCTS_Node = self.root
         while not node.is_leaf():
-            node = max(node.children, key=lambda child: child.uct())
+            children = [child for child in node.children if self.is_expandable(child)]
+            node = max(children, key=lambda child: (child.uct(virtual_loss_cost=self.get_virtual_loss_cost()), -child.prior))
         return node
 
+    def get_virtual_loss_cost(self) -> float:
+        #  The worst cost seen so far, or inf before any.
+        if self.worst_cost == float("-inf"):
+            return float("inf")
+        return self.worst_cost
+
+    def get_input(self, slot: Union[int, None] = None) -> PregenerateInput:
+        outdir = Path(__file__).parent / "mcts.out"
+        if slot is not None:
+            outdir = outdir / f"slot{slot}"
+        return PregenerateInput(
+            self.arch_config,
+            self.model,
+            self.seq_len,
+            outdir=outdir
+        )
+
     def get_leaf_factors(self, leaf: MCTS_Node):
-        _facs = {}
-        node = leaf
-        while not node.is_root():
-            _facs[node.name] = node.value
-            node = node.parent
-
-        dims = ["B", "D", "M", "P", "S"]
-        factors = None
-        for _factors in self.candidates:
-            if all([_factors["L3"][dim] == _facs[dim] for dim in dims]):
-                factors = _factors
-
-        assert factors != None
-        return factors
-
-    def search(self, iterations = 20):
-        for i in range(iterations):
+        assert leaf.index != None
+        return self.candidates[leaf.index]
+
+    def search(
+        self,
+        iterations = 20,
+        workers: int = 1,
+        time_budget: Union[float, None] = None,
+        patience: Union[int, None] = None,
+        checkpoint: Union[str, Path, None] = None,
+        checkpoint_every: int = 1
+    ):
+        """Search for the factors of the lowest cost, see `get_cost`.
+
+        Args:
+            iterations (int): The number of iterations, including the ones of a resumed checkpoint.
+            workers (int): The number of leaves evaluated at once, see `search_parallel`.
+            time_budget (Union[float, None]): Stop selecting leaves after this many seconds.
+            patience (Union[int, None]): Stop after this many iterations without a better cost.
+            checkpoint (Union[str, Path, None]): Resume from this file if it exists, and save the
+                search to it every `checkpoint_every` iterations. It is removed once the search
+                finishes, so only an interrupted search is resumed.
+
+        Returns:
+            The best factors found, or the front for the "pareto" objective.
+        """
+        done = 0
+        if checkpoint is not None and Path(checkpoint).exists():
+            done = self.load_checkpoint(checkpoint)
+            print(f"MCTS Search resumes at iter: {done} from {checkpoint}")
+
+        if workers > 1:
+            return self.search_parallel(iterations, workers, done, time_budget, patience, checkpoint, checkpoint_every)
+
+        start = time.monotonic()
+        for i in range(done, iterations):
+            if self.should_stop(start, time_budget, patience):
+                break
             print(f"MCTS Search iter: {i} arch_config: {self.arch_config.name}, model: {self.model}, seq_len: {self.seq_len}")
             leaf = self.select()
+            self.take_screen(leaf)
             factors = self.get_leaf_factors(leaf)
 
+            #  Other searches may have evaluated the leaf meanwhile.
+            self.pregenerate.refresh_index(self.arch_config, self.model, self.seq_len)
             pre_rst = self.pregenerate.read_from_file(
                 self.arch_config,
                 self.model,
@@ -130,22 +414,190 @@ class MCTS:
             )
 
             if pre_rst == None:
-                inp = PregenerateInput(
-                    self.arch_config,
-                    self.model,
-                    self.seq_len,
-                    outdir=Path(__file__).parent / "mcts.out"
-                )
+                self.record_prediction(leaf, factors)
                 pre_rst = self.pregenerate.pregenerate_factors(
-                    inp,
+                    self.get_input(),
                     factors,
                     True
                 )
 
-            cost = pre_rst["energy"]
-            leaf.backpropagate(cost)
-            self.update_best_leaf(factors, leaf, cost)
+            self.finish_iteration(leaf, factors, pre_rst)
+            done = i + 1
+            if checkpoint is not None and done % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint, done)
 
-        return self.best_factors
+        if checkpoint is not None:
+            #  Finished, so a later search starts over.
+            Path(checkpoint).unlink(missing_ok=True)
+        return self.get_result()
+
+    def search_parallel(
+        self,
+        iterations: int,
+        workers: int,
+        done: int = 0,
+        time_budget: Union[float, None] = None,
+        patience: Union[int, None] = None,
+        checkpoint: Union[str, Path, None] = None,
+        checkpoint_every: int = 1
+    ):
+        """`search` with up to `workers` leaves evaluated at once in worker processes.
+
+        Leaves are selected under virtual loss. Results are backpropagated in
+        the order the leaves were selected, and a new leaf is selected as soon
+        as a slot frees up, so the search does not depend on which worker
+        finishes first. Once a stopping rule fires, no new leaf is selected and
+        the ones in flight are waited for.
+        """
+        #  (iteration, leaf, factors, future or pregenerated result)
+        pending = deque()
+        selected = done
+        stopped = False
+        start = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while (selected < iterations and not stopped) or len(pending) != 0:
+                while selected < iterations and len(pending) < workers:
+                    if self.should_stop(start, time_budget, patience):
+                        stopped = True
+                        break
+                    leaf = self.select()
+                    if leaf.virtual_loss != 0:
+                        #  Already in flight, wait for a result first.
+                        break
+                    self.take_screen(leaf)
+                    factors = self.get_leaf_factors(leaf)
+                    print(f"MCTS Search iter: {selected} arch_config: {self.arch_config.name}, model: {self.model}, seq_len: {self.seq_len}")
+
+                    #  Other searches may have evaluated the leaf meanwhile.
+                    self.pregenerate.refresh_index(self.arch_config, self.model, self.seq_len)
+                    pre_rst = self.pregenerate.read_from_file(
+                        self.arch_config,
+                        self.model,
+                        self.seq_len,
+                        factors
+                    )
+                    if pre_rst == None:
+                        self.record_prediction(leaf, factors)
+                        #  Iteration i + workers is only selected once iteration i is done.
+                        pre_rst = executor.submit(evaluate_factors, self.get_input(selected % workers), factors)
+                    leaf.add_virtual_loss(1)
+                    pending.append((selected, leaf, factors, pre_rst))
+                    selected += 1
+
+                if len(pending) == 0:
+                    break
+                i, leaf, factors, pre_rst = pending.popleft()
+                if not isinstance(pre_rst, dict):
+                    pre_rst = pre_rst.result()
+                leaf.add_virtual_loss(-1)
+
+                self.finish_iteration(leaf, factors, pre_rst)
+                done = i + 1
+                #  Only the finished iterations are saved, the ones in flight are redone on resume.
+                if checkpoint is not None and done % checkpoint_every == 0:
+                    self.save_checkpoint(checkpoint, done)
+
+        if checkpoint is not None:
+            #  Finished, so a later search starts over.
+            Path(checkpoint).unlink(missing_ok=True)
+        return self.get_result()
+
+    def get_checkpoint(self, done: int) -> dict:
+        """The statistics of the visited leaves and the best leaf, from which the
+        tree can be rebuilt, since a node holds the sums of the leaves below it.
+        """
+        leaves = []
+        stack = [self.root]
+        while len(stack) != 0:
+            node = stack.pop()
+            if node.is_leaf():
+                if node.visits != 0 and node.index is not None:
+                    leaves.append({
+                        "factors": self.candidates[node.index],
+                        "visits": node.visits,
+                        "total_cost": node.total_cost
+                    })
+            else:
+                stack += node.children
+        return {
+            "arch": self.arch_config.name,
+            "model": self.model,
+            "seq_len": self.seq_len,
+            "iterations": done,
+            "stale": self.stale,
+            "objective": self.objective,
+            "latency_weight": self.latency_weight,
+            "best_cost": self.best_cost,
+            "best_factors": self.best_factors,
+            "worst_cost": self.worst_cost,
+            "front": self.front,
+            "leaves": leaves
+        }
+
+    def save_checkpoint(self, path: Union[str, Path], done: int):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.get_checkpoint(done), f)
+        os.replace(tmp_file, path)
+
+    def load_checkpoint(self, path: Union[str, Path]) -> int:
+        """Restore the tree statistics and the best leaf saved by `save_checkpoint`.
+
+        Returns:
+            int: The number of iterations done.
+        """
+        with open(path, "r") as f:
+            data = json.load(f)
+        if (data["arch"], data["model"], data["seq_len"]) != (self.arch_config.name, self.model, self.seq_len):
+            raise Exception(f"Checkpoint {path} is of {data['arch']}, {data['model']}, {data['seq_len']}.")
+        if (data["objective"], data["latency_weight"]) != (self.objective, self.latency_weight):
+            raise Exception(f"Checkpoint {path} is of the objective {data['objective']}, latency_weight {data['latency_weight']}.")
+
+        for leaf_data in data["leaves"]:
+            index = self.candidates.index(leaf_data["factors"])
+            if index is None:
+                #  Not a candidate of this search anymore.
+                continue
+            #  The leaf already holds its stored result, see build_from_factors.
+            leaf = self.get_leaf(index)
+            visits = leaf_data["visits"] - leaf.visits
+            total_cost = leaf_data["total_cost"] - leaf.total_cost
+            node = leaf
+            while node is not None:
+                node.visits += visits
+                node.total_cost += total_cost
+                node = node.parent
+
+        self.stale = data["stale"]
+        self.worst_cost = max(self.worst_cost, data["worst_cost"])
+        for point in data["front"]:
+            self.update_front(point["factors"], point["latency"], point["energy"])
+        best_factors = data["best_factors"]
+        if best_factors is not None and data["best_cost"] < self.best_cost:
+            index = self.candidates.index(best_factors)
+            self.best_cost = data["best_cost"]
+            self.best_factors = best_factors
+            self.best_leaf = self.get_leaf(index) if index is not None else None
+
+        #  Visited leaves need no screen.
+        for leaf_data in data["leaves"]:
+            index = self.candidates.index(leaf_data["factors"])
+            if index is not None:
+                self.take_screen(self.get_leaf(index))
+        return data["iterations"]
+
+    def get_leaf(self, index: int) -> MCTS_Node:
+        factors = self.candidates[index]
+        node = self.root
+        for dim in ["B", "D", "M", "P", "S"]:
+            node = node._children[factors["L3"][dim]]
+        return node
+
+def evaluate_factors(inp: PregenerateInput, factors: Dict[str, Dict[str, int]]) -> Dict[str, float]:
+    """Evaluate and store the factors of a leaf, in a worker process of `MCTS.search_parallel`.
+    """
+    return Pregenerate().pregenerate_factors(inp, factors, True)
 
 
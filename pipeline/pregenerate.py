@@ -5,14 +5,14 @@ from einsum.core import Einsum
 from pipeline.scheduler import Schedule
 from pipeline.session import Session, SessionOutput, SessionInput
 from pathlib import Path
-import fcntl
-import csv
-from typing import Dict
+from typing import Dict, Tuple, List
 from engine.timeloop import TimeloopResult
 from dataclasses import asdict
-import os
-from pathlib import Path
 from pipeline.core import TransFusion, TransFusionOptions, TransFusionTransformerOutputs
+from pipeline.store import ResultStore, RESULT_STORE, factors_to_key
+from pipeline.candidates import CandidateSet
+from pipeline.analytical import AnalyticalModel
+import numpy as np
 
 @dataclass(frozen=True)
 class PregenerateInput:
@@ -21,7 +21,21 @@ class PregenerateInput:
     seq_len: str
     outdir: Path
 
+RESULT_FIELDS = ["latency", "energy",
+                 "QKV.latency", "QKV.energy",
+                 "MHA.latency", "MHA.energy",
+                 "LayerNorm.latency", "LayerNorm.energy",
+                 "FFN.latency", "FFN.energy"]
+
 class Pregenerate:
+    #  (db file, arch, model, seq_len) -> {factors key: {"latency": ..., "energy": ...}}
+    indexes: Dict[Tuple[str, str, str, str], Dict[str, Dict[str, float]]] = {}
+    #  The last store row read into each index, see refresh_index.
+    index_rowids: Dict[Tuple[str, str, str, str], int] = {}
+
+    def __init__(self, store: ResultStore = RESULT_STORE):
+        self.store = store
+
     def factors_to_field_values(self, factors: Dict[str, Dict[str, int]]):
         fields = []
         values = {}
@@ -33,11 +47,7 @@ class Pregenerate:
         return fields, values
 
     def result_to_field_values(self, outp: TransFusionTransformerOutputs):
-        fields = ["latency", "energy",
-                  "QKV.latency", "QKV.energy",
-                  "MHA.latency", "MHA.energy",
-                  "LayerNorm.latency", "LayerNorm.energy",
-                  "FFN.latency", "FFN.energy"]
+        fields = RESULT_FIELDS.copy()
         values = {"latency": outp.latency, "energy": outp.energy,
                   "QKV.latency": outp.einsums_outputs["QKV"].latency, "QKV.energy": outp.einsums_outputs["QKV"].energy,
                   "MHA.latency": outp.einsums_outputs["MHA"].latency, "MHA.energy": outp.einsums_outputs["MHA"].energy,
@@ -47,22 +57,46 @@ class Pregenerate:
         return fields, values
 
 
+    def load_index(self, arch_config: ArchConfig, model: str, seq_len: str) -> Dict[str, Dict[str, float]]:
+        """Load the results of (arch, model, seq_len) once into a hash index.
+        """
+        index_key = (str(self.store.db_file), arch_config.name, model, seq_len)
+        if index_key not in Pregenerate.indexes:
+            Pregenerate.indexes[index_key] = {}
+            Pregenerate.index_rowids[index_key] = 0
+            self.refresh_index(arch_config, model, seq_len)
+        return Pregenerate.indexes[index_key]
+
+    def refresh_index(self, arch_config: ArchConfig, model: str, seq_len: str):
+        """Add to the index the results stored since it was last read, e.g. by
+        other processes, in one query.
+        """
+        index_key = (str(self.store.db_file), arch_config.name, model, seq_len)
+        if index_key not in Pregenerate.indexes:
+            self.load_index(arch_config, model, seq_len)
+            return
+        index = Pregenerate.indexes[index_key]
+        rsts, Pregenerate.index_rowids[index_key] = self.store.get_since(
+            arch_config.name, model, seq_len, Pregenerate.index_rowids[index_key])
+        for rst in rsts:
+            index.setdefault(factors_to_key(rst["factors"]), {"latency": rst["latency"], "energy": rst["energy"]})
+
     def write_to_file(self, inp: PregenerateInput, outp: TransFusionTransformerOutputs):
-        file_path = Path(__file__).parent / "pregenerate"
-        file_path.mkdir(parents=True, exist_ok=True)
-        file_path /= f"{inp.arch_config.name}_{inp.model}_{inp.seq_len}.csv"
-        with open(file_path, "a", newline="") as f:
-            f1, v1 = self.factors_to_field_values(outp.factors)
-            f2, v2 = self.result_to_field_values(outp)
-            writer = csv.DictWriter(f, fieldnames=f1+f2)
-
-            if os.stat(file_path).st_size == 0:
-                writer.writeheader()
-
-            row = {}
-            row.update(v1)
-            row.update(v2)
-            writer.writerow(row)
+        _, values = self.result_to_field_values(outp)
+        self.store.insert(
+            inp.arch_config.name,
+            inp.model,
+            inp.seq_len,
+            outp.factors,
+            outp.latency,
+            outp.energy,
+            {k: v for k, v in values.items() if k not in ["latency", "energy"]}
+        )
+
+        index = self.load_index(inp.arch_config, inp.model, inp.seq_len)
+        key = factors_to_key(outp.factors)
+        if key not in index:
+            index[key] = {"latency": outp.latency, "energy": outp.energy}
 
     def read_from_file(
         self,
@@ -71,23 +105,13 @@ class Pregenerate:
         seq_len: str,
         factors: Dict[str, Dict[str, int]]) -> Dict[str, float]:
 
-        file_path = Path(__file__).parent / "pregenerate"
-        file_path /= f"{arch_config.name}_{model}_{seq_len}.csv"
-
-        if not file_path.exists():
+        #  Results written by other processes since the index was loaded are
+        #  only seen after refresh_index.
+        index = self.load_index(arch_config, model, seq_len)
+        key = factors_to_key(factors)
+        if key not in index:
             return None
-
-        _, values = self.factors_to_field_values(factors)
-
-        with open(file_path, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if all(row.get(col) == str(val) for col, val in values.items()):
-                    return {
-                        "latency": float(row.get("latency")),
-                        "energy": float(row.get("energy"))
-                    }
-        return None
+        return index[key].copy()
 
     def pregenerate_factors(
         self,
@@ -137,3 +161,38 @@ class Pregenerate:
 
             if write:
                 self.write_to_file(inp, outp)
+
+    def pregenerate_screened(
+        self,
+        inp: PregenerateInput,
+        candidates: CandidateSet,
+        top_k: int,
+        write: bool = True
+    ) -> List[Dict[str, float]]:
+        """Fully evaluate the top_k candidates by analytical energy that have no result yet.
+
+        The analytical estimates of the evaluated candidates are stored
+        together with their results, see ResultStore.get_analytical.
+        """
+        arch_config = inp.arch_config
+        model = inp.model
+        seq_len = inp.seq_len
+
+        estimates = AnalyticalModel(arch_config, model, seq_len).evaluate(candidates)
+        rsts = []
+        for i in np.argsort(estimates["energy"], kind="stable"):
+            if len(rsts) == top_k:
+                break
+            factors = candidates[i]
+            if self.read_from_file(arch_config, model, seq_len, factors) != None:
+                continue
+
+            print(f"{arch_config.name}, {model}, {seq_len}, {len(rsts)} ...")
+            rst = self.pregenerate_factors(inp, factors, write)
+            if write:
+                self.store.insert_analytical(
+                    arch_config.name, model, seq_len, factors,
+                    float(estimates["latency"][i]), float(estimates["energy"][i]), float(estimates["dram_traffic"][i]),
+                    rst["latency"], rst["energy"])
+            rsts.append(rst)
+        return rsts
@@ -1,9 +1,11 @@
 import random
 import math
+import time
 from itertools import chain, combinations
 import networkx as nx
-from typing import Dict, List, Tuple
-from dataclasses import dataclass
+import numpy as np
+from typing import Dict, List, Tuple, Union, Callable, Iterator
+from dataclasses import dataclass, replace
 from config.arch import PE
 
 def split_dag(graph, fixed_nodes):
@@ -56,105 +58,173 @@ def split_dag(graph, fixed_nodes):
     return all_splits
 
 def split_dag2(graph):
-    _graph = graph
-    graph = nx.DiGraph(_graph)
-    start_nodes = [n for n in graph.nodes if graph.in_degree(n) == 0]
-    end_nodes = [n for n in graph.nodes if graph.out_degree(n) == 0]
+    """Split the DAG into two weakly connected parts scheduled side by side.
 
-    if len(start_nodes) < 1 or len(end_nodes) < 1:
+    The first part is a predecessor-closed set of nodes that contains every
+    start node and no end node, and is reachable from each of its start
+    nodes. Such sets are the ideals of the DAG, which are enumerated directly
+    on bitmasks instead of testing every subset of the nodes.
+    """
+    _graph = graph
+    nodes = list(graph.keys())
+    nodes += [v for u in graph for v in graph[u] if v not in nodes]
+    index = {node: i for i, node in enumerate(nodes)}
+    succs = [[] for _ in nodes]
+    for u in graph:
+        for v in graph[u]:
+            if index[v] not in succs[index[u]]:
+                succs[index[u]].append(index[v])
+    preds = [[] for _ in nodes]
+    for u in range(len(nodes)):
+        for v in succs[u]:
+            preds[v].append(u)
+
+    succ_mask = [sum(1 << v for v in succs[u]) for u in range(len(nodes))]
+    pred_mask = [sum(1 << v for v in preds[u]) for u in range(len(nodes))]
+    start_mask = sum(1 << u for u in range(len(nodes)) if len(preds[u]) == 0)
+    end_mask = sum(1 << u for u in range(len(nodes)) if len(succs[u]) == 0)
+    start_nodes = [nodes[u] for u in range(len(nodes)) if start_mask >> u & 1]
+
+    if start_mask == 0 or end_mask == 0:
         raise ValueError("Graph must have at least one start and one end node.")
 
-    nodes = set(graph.nodes)
-    all_splits = []
+    all_mask = (1 << len(nodes)) - 1
+
+    def bits(mask):
+        return [u for u in range(len(nodes)) if mask >> u & 1]
+
+    def reachable(source, mask, adj):
+        reach = 1 << source
+        frontier = reach
+        while frontier:
+            _next = 0
+            for u in bits(frontier):
+                _next |= adj[u]
+            frontier = _next & mask & ~reach
+            reach |= frontier
+        return reach
+
+    undirected = [succ_mask[u] | pred_mask[u] for u in range(len(nodes))]
+    def is_weakly_connected(mask):
+        return reachable(bits(mask)[0], mask, undirected) == mask
+
+    def controlable(mask, starts):
+        for u in bits(starts):
+            if reachable(u, mask, succ_mask) != mask & ~starts | (1 << u):
+                return False
+        return True
 
-    def all_subsets(iterable):
-        """Returns all non-empty subsets of the iterable."""
-        s = list(iterable)
-        return chain.from_iterable(combinations(s, r) for r in range(1, len(s) + 1))
+    #  Enumerate the ideals, deciding the nodes in a topological order.
+    topo = []
+    _in_degree = [len(preds[u]) for u in range(len(nodes))]
+    ready = [u for u in range(len(nodes)) if _in_degree[u] == 0]
+    while ready:
+        u = ready.pop(0)
+        topo.append(u)
+        for v in succs[u]:
+            _in_degree[v] -= 1
+            if _in_degree[v] == 0:
+                ready.append(v)
+
+    ideals = []
+    def enumerate_ideals(i, mask):
+        if i == len(topo):
+            ideals.append(mask)
+            return
+        u = topo[i]
+        if start_mask >> u & 1:
+            enumerate_ideals(i + 1, mask | (1 << u))
+            return
+        if not end_mask >> u & 1 and pred_mask[u] & mask == pred_mask[u]:
+            enumerate_ideals(i + 1, mask | (1 << u))
+        enumerate_ideals(i + 1, mask)
+    enumerate_ideals(0, 0)
+    ideals.sort(key=lambda mask: (bin(mask).count("1"), bits(mask)))
 
-    for subset in all_subsets(nodes - set(end_nodes)):
-        subset = set(subset)
-        if any(x not in subset for x in start_nodes):
+    all_splits = []
+    for subset in ideals:
+        other_subset = all_mask & ~subset
+        if not is_weakly_connected(subset) or not is_weakly_connected(other_subset):
             continue
 
-        def is_dependency_available(subset, graph):
-            for node in subset:
-                for p_node in graph.predecessors(node):
-                    if p_node not in subset:
-                        return False
-            return True
-
-        if not is_dependency_available(subset, graph):
+        #  The subset is predecessor-closed, so its start nodes are the ones
+        #  of the graph.
+        other_start = sum(1 << u for u in bits(other_subset) if pred_mask[u] & other_subset == 0)
+        if not controlable(subset, start_mask):
             continue
 
-        other_subset = nodes - subset
-        subgraph1 = graph.subgraph(subset).copy()
-        subgraph2 = graph.subgraph(other_subset).copy()
+        new_graph = {
+            "ROOT": start_nodes + [nodes[u] for u in bits(other_start)]
+        }
 
-        def controlable(start_nodes, subgraph):
-            for node in start_nodes:
-                reachable = nx.descendants(subgraph, node)
-                if len(reachable) != len(subgraph.nodes) - len(start_nodes):
-                    return False
-            return True
+        subgraph1_dict = {nodes[u]: [nodes[v] for v in succs[u] if subset >> v & 1] for u in bits(subset)}
+        subgraph2_dict = {nodes[u]: [nodes[v] for v in succs[u] if other_subset >> v & 1] for u in bits(other_subset)}
 
-        def is_valid_subgraph(graph):
-            return nx.is_directed_acyclic_graph(graph) and nx.is_weakly_connected(graph)
+        new_graph.update(subgraph1_dict)
+        new_graph.update(subgraph2_dict)
 
-        if is_valid_subgraph(subgraph1) and is_valid_subgraph(subgraph2):
-            subgraph1_start_nodes = [n for n in subgraph1.nodes if subgraph1.in_degree(n) == 0]
-            subgraph2_start_nodes = [n for n in subgraph2.nodes if subgraph2.in_degree(n) == 0]
+        if "SPD" in subgraph1_dict.keys() and "RD" in subgraph2_dict.keys():
+            new_graph["RD"].append("SPD")
+        if "SPNV" in subgraph1_dict.keys() and "RNV" in subgraph2_dict.keys():
+            new_graph["RNV"].append("SPNV")
 
-            if not controlable(subgraph1_start_nodes, subgraph1):
-                continue
-
-            new_graph = {
-                "ROOT": subgraph1_start_nodes + subgraph2_start_nodes
-            }
-
-            subgraph1_dict = {node: list(subgraph1.successors(node)) for node in subgraph1.nodes}
-            subgraph2_dict = {node: list(subgraph2.successors(node)) for node in subgraph2.nodes}
-
-            new_graph.update(subgraph1_dict)
-            new_graph.update(subgraph2_dict)
-
-            if "SPD" in subgraph1_dict.keys() and "RD" in subgraph2_dict.keys():
-                new_graph["RD"].append("SPD")
-            if "SPNV" in subgraph1_dict.keys() and "RNV" in subgraph2_dict.keys():
-                new_graph["RNV"].append("SPNV")
-
-            all_splits.append(new_graph)
+        all_splits.append(new_graph)
 
     new_graph = {"ROOT": start_nodes}
     new_graph.update(_graph)
     all_splits.append(new_graph)
     return all_splits
 
-def all_topological_sorts(graph):
+def iter_topological_sorts(
+    graph: Dict[str, List[str]],
+    prune: Callable[[List[str]], bool] = None
+) -> Iterator[List[str]]:
+    """Yield the topological orders of the DAG lazily, depth first.
+
+    Args:
+        graph (Dict[str, List[str]]): The DAG.
+        prune (Callable[[List[str]], bool], optional): Called with every new
+            prefix; the orders starting with the prefix are skipped if it
+            returns True. Defaults to None.
+    """
+    nodes = list(graph)
     in_degree = {u: 0 for u in graph}
     for u in graph:
         for v in graph[u]:
             in_degree[v] += 1
-    result = []
     visited = set()
-    def dfs(current_sort):
-        if len(current_sort) == len(graph):
-            result.append(current_sort[:])
-            return
-        for node in graph:
+    current_sort = []
+
+    def pop():
+        node = current_sort.pop()
+        visited.remove(node)
+        for neighbor in graph[node]:
+            in_degree[neighbor] += 1
+
+    #  One iterator over the candidate nodes per position of the prefix.
+    stack = [iter(nodes)]
+    while stack:
+        for node in stack[-1]:
             if in_degree[node] == 0 and node not in visited:
-                visited.add(node)
-                current_sort.append(node)
-                for neighbor in graph[node]:
-                    in_degree[neighbor] -= 1
-                dfs(current_sort)
-                visited.remove(node)
-                current_sort.pop()
-                for neighbor in graph[node]:
-                    in_degree[neighbor] += 1
-
-    dfs([])
-    return result
+                break
+        else:
+            stack.pop()
+            if len(current_sort) != 0:
+                pop()
+            continue
+
+        visited.add(node)
+        current_sort.append(node)
+        for neighbor in graph[node]:
+            in_degree[neighbor] -= 1
+
+        if prune is not None and prune(current_sort):
+            pop()
+        elif len(current_sort) == len(nodes):
+            yield current_sort[:]
+            pop()
+        else:
+            stack.append(iter(nodes))
 
 def reverse_graph(graph):
     reversed_graph = {node: [] for node in graph}
@@ -214,16 +284,25 @@ def schedule_operators(ops, time_1d, time_2d, dependencies):
             t_1d = end_time_1d
     return (timelines, max(t_1d, t_2d))
 
+def find_head_gap(schs):
+    """The idle time of an engine before its first operator.
+    """
+    if len(schs) == 0:
+        return float("inf")
+    return min([sch[2] for sch in schs])
+
+def find_tail_gap(schs, end_time):
+    """The idle time of an engine after its last operator.
+    """
+    if len(schs) == 0:
+        return float("inf")
+    _end_time = max([sch[3] for sch in schs])
+    return end_time - _end_time
+
 def schedule_pipeline(schedules, min_latency):
     #schedules, min_latency = schedule_pipeline2(ops, [time_1d, time_2d], dependencies=dependencies)
-    def find_head_gap(schs):
-        start_time = min([sch[2] for sch in schs])
-        return start_time
     def get_operations_in_time_range(schs, time_range):
         return [sch[0] for sch in schs if (sch[2] >= time_range[0] and sch[3] <= time_range[1])]
-    def find_tail_gap(schs, end_time):
-        _end_time = max([sch[3] for sch in schs])
-        return end_time - _end_time
     def shift_ops_to_tails(schs, ops):
         shifted_schs = []
         unshifted_schs = []
@@ -257,6 +336,8 @@ def schedule_pipeline(schedules, min_latency):
 
     schs_1d = [sch for sch in schedules if sch[1] == 0]
     schs_2d = [sch for sch in schedules if sch[1] == 1]
+    if len(schs_1d) == 0 or len(schs_2d) == 0:
+        return schedules, min_latency
 
     head_gap_1d = find_head_gap(schs_1d)
     head_gap_2d = find_head_gap(schs_2d)
@@ -275,44 +356,303 @@ def schedule_pipeline(schedules, min_latency):
     schedules = [sch for schs in schs_list for sch in schs]
     return schedules, min_latency
 
-def simulated_annealing(candidates, schedule_func, valid_func, initial_temp=100, cooling_rate=0.95, max_iter=1000):
-    def random_candidate():
-        return random.choice(candidates)
-    current_candidate = random_candidate()
-    _schedule, _min_latency = schedule_func(current_candidate)
-    best_schedule = _schedule
-    best_latency = _min_latency
+def pipeline_groups(sch_rsts: List["ScheduleResult"]) -> float:
+    """The latency of einsum groups run one after another with their
+    schedules overlapped.
+
+    A group starts as soon as every engine it uses is free, so the tail gap of
+    an engine in one group overlaps the head gap of the same engine in the
+    next one. A group never starts before the previous one.
+
+    Args:
+        sch_rsts (List[ScheduleResult]): The schedules of the groups, in order.
+
+    Returns:
+        float: The end-to-end latency.
+    """
+    free_time = {pe: 0.0 for pe in PE}
+    start_time = 0.0
+    end_time = 0.0
+    for sch_rst in sch_rsts:
+        schs = {
+            pe: [(sch.einsum, pe, sch.start_time, sch.end_time) for sch in sch_rst.schedules.values() if sch.pe == pe]
+            for pe in PE
+        }
+        for pe in PE:
+            if len(schs[pe]) != 0:
+                start_time = max(start_time, free_time[pe] - find_head_gap(schs[pe]))
+        for pe in PE:
+            if len(schs[pe]) != 0:
+                free_time[pe] = start_time + sch_rst.latency - find_tail_gap(schs[pe], sch_rst.latency)
+        end_time = max(end_time, start_time + sch_rst.latency)
+    return end_time
+
+def simulated_annealing(
+    dependencies: Dict[str, List[str]],
+    times: List[Dict[str, float]],
+    deadline: float = None,
+    max_iter: int = 1000,
+    neighbours: int = 32,
+    initial_temp: float = 0.05,
+    cooling_rate: float = 0.995,
+    seed: int = 0
+) -> Tuple[List[str], float]:
+    """Search a topological order with a small `schedule_operators2` makespan.
+
+    A move takes one operator out of the order and puts it back anywhere
+    between its last predecessor and its first successor, so every visited
+    order respects the dependencies. Each step scores a batch of random moves
+    with `schedule_orders` and takes the best one under the Metropolis rule.
+    The temperature is relative to the current latency.
+
+    Args:
+        dependencies (Dict[str, List[str]]): The DAG.
+        times (List[Dict[str, float]]): The latency of each operator on each engine.
+        deadline (float, optional): time.monotonic() after which the search stops.
+            Defaults to None.
+        max_iter (int, optional): The maximal number of steps. Defaults to 1000.
+        neighbours (int, optional): The moves scored per step. Defaults to 32.
+        seed (int, optional): Seed of the moves. Defaults to 0.
+
+    Returns:
+        Tuple[List[str], float]: (best order, its latency).
+    """
+    ops, _, latency, preds = compile_orders([], times, dependencies)
+    index = {op: i for i, op in enumerate(ops)}
+    succs = [[index[n] for n in dependencies[op]] for op in ops]
+    _preds = [list(np.nonzero(preds[i])[0]) for i in range(len(ops))]
+    rng = random.Random(seed)
+
+    def move(order: List[int]) -> List[int]:
+        pos = [0] * len(order)
+        for k, i in enumerate(order):
+            pos[i] = k
+        k = rng.randrange(len(order))
+        i = order[k]
+        lo = max([pos[p] + 1 for p in _preds[i]], default=0)
+        hi = min([pos[n] - 1 for n in succs[i]], default=len(order) - 1)
+        new_order = order[:k] + order[k+1:]
+        new_order.insert(rng.randint(lo, hi), i)
+        return new_order
+
+    current = [index[op] for op in next(iter_topological_sorts(dependencies))]
+    current_latency = schedule_orders(np.array([current]), latency, preds)[0]
+    best = current
+    best_latency = current_latency
     temperature = initial_temp
 
     for _ in range(max_iter):
-        new_candidate = current_candidate[:]
-        i, j = random.sample(range(len(new_candidate)), 2)
-        new_candidate[i], new_candidate[j] = new_candidate[j], new_candidate[i]
-        if not valid_func(new_candidate):
-            continue
+        if deadline is not None and time.monotonic() > deadline:
+            break
 
-        _schedule, _min_latency = schedule_func(current_candidate)
-        delta = -(_min_latency - best_latency)
+        candidates = [move(current) for _ in range(neighbours)]
+        makespans = schedule_orders(np.array(candidates), latency, preds)
+        k = int(np.argmin(makespans))
+
+        if makespans[k] <= current_latency:
+            accept = True
+        else:
+            delta = (makespans[k] - current_latency) / current_latency
+            accept = rng.random() < math.exp(-delta / temperature)
 
-        if delta > 0 or random.random() < math.exp(delta/temperature):
-            current_candidate = new_candidate
-            if _min_latency < best_latency:
-                best_schedule = _schedule
-                best_latency = _min_latency
+        if accept:
+            current = candidates[k]
+            current_latency = makespans[k]
+            if current_latency < best_latency:
+                best = current
+                best_latency = current_latency
 
         temperature *= cooling_rate
 
-    return best_schedule, best_latency
+    return [ops[i] for i in best], float(best_latency)
 
-def traverse_candidates(candidates, schedule_func):
-    best_schedule = None
-    best_latency = float("inf")
-    for candidate in candidates:
-        _schedule, _min_latency = schedule_func(candidate)
-        if _min_latency < best_latency:
-            best_schedule = _schedule
-            best_latency = _min_latency
-    return best_schedule, best_latency
+def schedule_lower_bound(dependencies: Dict[str, List[str]], times: List[Dict[str, float]]) -> float:
+    """A lower bound of the makespan of any order of the DAG.
+
+    It is the max of the critical path on the fastest engines and of the
+    total work spread over all the engines.
+    """
+    min_times = {op: min(_times[op] for _times in times) for op in dependencies}
+    tails = {}
+    def tail(op: str) -> float:
+        if op not in tails:
+            tails[op] = min_times[op] + max([tail(n) for n in dependencies[op]], default=0)
+        return tails[op]
+    critical_path = max([tail(op) for op in dependencies], default=0)
+    return max(critical_path, sum(min_times.values()) / len(times))
+
+def compile_orders(
+    candidates: List[List[str]],
+    times: List[Dict[str, float]],
+    dependencies: Dict[str, List[str]]
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Compile topological orders into the arrays of `schedule_orders`.
+
+    Returns:
+        Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]: The operators, the
+            (orders x ops) matrix of operator indices, the (engines x ops)
+            latency matrix and the (ops x ops) predecessor matrix.
+    """
+    ops = list(dependencies.keys())
+    index = {op: i for i, op in enumerate(ops)}
+    orders = np.array([[index[op] for op in candidate] for candidate in candidates], dtype=np.int64)
+    latency = np.array([[_times[op] for op in ops] for _times in times], dtype=np.float64)
+    preds = np.zeros((len(ops), len(ops)), dtype=bool)
+    for op, succs in dependencies.items():
+        for succ in succs:
+            preds[index[succ], index[op]] = True
+    return ops, orders.reshape(len(candidates), len(ops)), latency, preds
+
+def schedule_orders(orders: np.ndarray, latency: np.ndarray, preds: np.ndarray) -> np.ndarray:
+    """The `schedule_operators2` makespans of many orders at once.
+
+    The operators are placed position by position as in `schedule_operators2`,
+    vectorized over the orders: each goes to the engine where it ends first,
+    the engine with the highest index on ties.
+
+    Args:
+        orders (np.ndarray): The (orders x ops) matrix of operator indices.
+        latency (np.ndarray): The (engines x ops) latency matrix.
+        preds (np.ndarray): preds[i, j] is True if operator j precedes operator i.
+
+    Returns:
+        np.ndarray: The makespan of each order.
+    """
+    count, ops_count = orders.shape
+    dimensions = latency.shape[0]
+    rows = np.arange(count)
+    t = np.zeros((count, dimensions))
+    end_time = np.zeros((count, ops_count))
+    for k in range(ops_count):
+        ops = orders[:, k]
+        dep_max_end_time = np.where(preds[ops], end_time, 0).max(axis=1)
+        _end_time = np.maximum(t, dep_max_end_time[:, None]) + latency[:, ops].T
+        min_arg = dimensions - 1 - np.argmin(_end_time[:, ::-1], axis=1)
+        min_val = _end_time[rows, min_arg]
+        t[rows, min_arg] = min_val
+        end_time[rows, ops] = min_val
+    return t.max(axis=1)
+
+def branch_and_bound(
+    dependencies: Dict[str, List[str]],
+    times: List[Dict[str, float]],
+    upper_bound: float = float("inf"),
+    deadline: float = None
+) -> Tuple[List[str], float]:
+    """Find the topological order with the minimal `schedule_operators2` makespan.
+
+    Orders are streamed from `iter_topological_sorts` and a prefix is cut
+    once its lower bound reaches the best latency found so far, so the first
+    optimal order of the enumeration is returned. The lower bound of a prefix is the max of
+    - the busiest engine,
+    - the critical path (on the fastest engine) of every ready operator,
+    - the remaining work spread over all the engines.
+    Prefixes leading to an already visited state are cut as well.
+
+    Args:
+        dependencies (Dict[str, List[str]]): The DAG.
+        times (List[Dict[str, float]]): The latency of each operator on each engine.
+        upper_bound (float, optional): Only orders strictly better than it are
+            returned. Defaults to inf.
+        deadline (float, optional): time.monotonic() after which the best order
+            found so far is returned, starting from a greedy list-schedule order.
+            Defaults to None (exact).
+
+    Returns:
+        Tuple[List[str], float]: (best order, its latency). The order is None
+            if there is no order better than upper_bound.
+    """
+    ops = list(dependencies.keys())
+    index = {op: i for i, op in enumerate(ops)}
+    dimensions = len(times)
+    op_times = [[times[d][op] for d in range(dimensions)] for op in ops]
+    min_times = [min(ts) for ts in op_times]
+    preds = [[index[p] for p in reverse_graph(dependencies)[op]] for op in ops]
+    succs = [[index[n] for n in dependencies[op]] for op in ops]
+
+    #  The critical path from each op to the end, on the fastest engines.
+    tails = [0.0] * len(ops)
+    remaining = set(range(len(ops)))
+    while remaining:
+        for i in list(remaining):
+            if all(j not in remaining for j in succs[i]):
+                tails[i] = min_times[i] + max([tails[j] for j in succs[i]], default=0)
+                remaining.remove(i)
+
+    preds_mask = [sum(1 << p for p in preds[i]) for i in range(len(ops))]
+    end_time = [0.0] * len(ops)
+    best_latency = upper_bound
+    seen = set()
+    counter = 0
+    #  (t, visited, remaining work) after each prefix length.
+    states = [((0,) * dimensions, 0, sum(min_times))]
+
+    def lower_bound(t: Tuple[float], visited: int, remaining_work: float) -> float:
+        lb = max(t)
+        min_t = min(t)
+        for i in range(len(ops)):
+            if visited >> i & 1 or preds_mask[i] & visited != preds_mask[i]:
+                continue
+            ready = max([end_time[p] for p in preds[i]], default=0)
+            lb = max(lb, max(min_t, ready) + tails[i])
+        return max(lb, (sum(t) + remaining_work) / dimensions)
+
+    def prune(prefix: List[str]) -> bool:
+        nonlocal counter
+        counter += 1
+        if deadline is not None and counter % 1024 == 0 and time.monotonic() > deadline:
+            raise TimeoutError
+
+        del states[len(prefix):]
+        t, visited, remaining_work = states[-1]
+        i = index[prefix[-1]]
+        dep_max_end_time = max([end_time[p] for p in preds[i]], default=0)
+        _end_time = [max(t[d], dep_max_end_time) + op_times[i][d] for d in range(dimensions)]
+        min_val = min(_end_time)
+        min_arg = max(d for d, v in enumerate(_end_time) if v == min_val)
+
+        t = t[:min_arg] + (min_val,) + t[min_arg+1:]
+        end_time[i] = min_val
+        visited = visited | (1 << i)
+        remaining_work = remaining_work - min_times[i]
+
+        state = (visited, t, tuple(
+            end_time[j] for j in range(len(ops))
+            if visited >> j & 1 and any(not visited >> k & 1 for k in succs[j])))
+        if state in seen or lower_bound(t, visited, remaining_work) >= best_latency:
+            return True
+        seen.add(state)
+        states.append((t, visited, remaining_work))
+        return False
+
+    best_order = None
+    if deadline is not None:
+        #  Start from a greedy order, most critical ready operator first, so
+        #  that an order is returned even if the deadline passes right away.
+        order = []
+        visited = 0
+        while len(order) < len(ops):
+            ready = [
+                i for i in range(len(ops))
+                if not visited >> i & 1 and preds_mask[i] & visited == preds_mask[i]
+            ]
+            i = max(ready, key=lambda i: (tails[i], -i))
+            order.append(ops[i])
+            visited |= 1 << i
+        _, latency = schedule_operators2(order, times, dependencies)
+        if latency < best_latency:
+            best_order = order
+            best_latency = latency
+
+    try:
+        for order in iter_topological_sorts(dependencies, prune):
+            latency = max(states[-1][0])
+            if latency < best_latency:
+                best_order = order
+                best_latency = latency
+    except TimeoutError:
+        pass
+    return best_order, best_latency
 
 EINSUMS_DEPENDENCY = {
     "QK": ["LM"],
@@ -328,6 +668,10 @@ EINSUMS_DEPENDENCY = {
     "RNV": ["AV"],
     "AV": []}
 
+#  Bump when a change of the scheduler changes its results, to invalidate the
+#  cached schedules, see ScheduleCache.
+SCHEDULER_VERSION = 3
+
 @dataclass(frozen=True)
 class Schedule:
     einsum: str
@@ -343,17 +687,56 @@ class ScheduleResult:
     schedules: Dict[str, Schedule]
     latency: float
     dag: dict
+    lower_bound: float = 0.0
+
+    @property
+    def gap(self) -> float:
+        """The relative gap of the latency to the lower bound.
+        """
+        if self.lower_bound <= 0:
+            return float("inf")
+        return self.latency / self.lower_bound - 1
+
+def check_mode(mode: str, time_budget: Union[float, None]):
+    if mode not in ["exact", "anneal"]:
+        raise Exception(f"Unknown scheduler mode {mode}.")
+    if mode == "anneal" and time_budget is None:
+        #  Annealing runs max_iter steps on each split otherwise, far slower than exact.
+        raise Exception("The anneal scheduler mode needs a time_budget.")
 
 def run_scheduler(
     einsums_latency: Dict[str, List[float]],
-    dependencies: Dict[str, List[str]]=EINSUMS_DEPENDENCY
+    dependencies: Dict[str, List[str]]=EINSUMS_DEPENDENCY,
+    time_budget: float = None,
+    mode: str = "exact"
 ) -> ScheduleResult:
+    """Schedule the DAG on the 1D and 2D engines.
+
+    Args:
+        einsums_latency (Dict[str, List[float]]): The [1D, 2D] latency of each einsum.
+        dependencies (Dict[str, List[str]], optional): The DAG.
+        time_budget (float, optional): Wall-clock seconds after which the best
+            schedule found so far is returned. Defaults to None (exact).
+        mode (str, optional): "exact" for `branch_and_bound`, "anneal" for
+            `simulated_annealing` on DAGs too large to enumerate, which needs a
+            time_budget. Defaults to "exact".
+    """
+    check_mode(mode, time_budget)
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    return _run_scheduler(einsums_latency, dependencies, deadline=deadline, mode=mode)
+
+def _run_scheduler(
+    einsums_latency: Dict[str, List[float]],
+    dependencies: Dict[str, List[str]],
+    upper_bound: float = float("inf"),
+    deadline: float = None,
+    mode: str = "exact"
+) -> Union[ScheduleResult, None]:
     einsums_latency = einsums_latency.copy()
     for einsum in dependencies.keys():
         if einsum not in einsums_latency:
             einsums_latency[einsum] = [0, 0]
 
-    candidates = all_topological_sorts(dependencies)
     time_1d = {}
     time_2d = {}
 
@@ -361,37 +744,36 @@ def run_scheduler(
         time_1d[op] = einsums_latency[op][0]
         time_2d[op] = einsums_latency[op][1]
 
-    def schedule_func(candidate):
-        _schedules, _min_latency = schedule_operators2(
-                candidate, [time_1d, time_2d], dependencies)
-
-        return _schedules, _min_latency
+    if mode == "exact":
+        candidate, _ = branch_and_bound(dependencies, [time_1d, time_2d], upper_bound, deadline)
+    elif mode == "anneal":
+        candidate, latency = simulated_annealing(dependencies, [time_1d, time_2d], deadline)
+        if not latency < upper_bound:
+            candidate = None
+    else:
+        raise Exception(f"Unknown scheduler mode {mode}.")
+    if candidate is None:
+        return None
 
-    def valid_func(candidate):
-        for i in range(len(candidate)):
-            op = candidate[i]
-            deps = dependencies[op]
-            for dep in deps:
-                if dep not in candidate[i:]:
-                    return False
-        return True
-    # _schedule, _min_latency = simulated_annealing(
-    #     candidates, schedule_func, valid_func, max_iter=10000)
-    _schedule, _min_latency = traverse_candidates(candidates, schedule_func)
+    _schedule, _min_latency = schedule_operators2(
+        candidate, [time_1d, time_2d], dependencies)
 
     _schedule = [item for item in _schedule if item[0] != "ROOT"]
 
     return ScheduleResult(
         schedules=deserialize(_schedule),
         latency=_min_latency,
-        dag=dependencies
+        dag=dependencies,
+        lower_bound=schedule_lower_bound(dependencies, [time_1d, time_2d])
     )
 
 def run_scheduler2(
     einsums_latency: Dict[str, List[float]],
     dependencies: Dict[str, List[str]],
     einsums_disable_break: List[str]=["RM", "RD"],
-    dimensions_count=2) -> Tuple[Dict[str, Schedule], float]:
+    dimensions_count=2,
+    time_budget: float = None,
+    mode: str = "exact") -> ScheduleResult:
     def find_all_links(edges, targets = []):
         if targets == None:
             return None
@@ -410,6 +792,7 @@ def run_scheduler2(
             parents.add(target)
         return parents
 
+    check_mode(mode, time_budget)
     einsums_disable_break = [ein for ein in einsums_disable_break if ein in einsums_latency]
     if len(einsums_disable_break) == 0:
         einsums_disable_break = None
@@ -419,16 +802,39 @@ def run_scheduler2(
 
     disable_break = find_all_links(dependencies, einsums_disable_break)
 
+    deadline = None if time_budget is None else time.monotonic() + time_budget
     dags = split_dag2(dependencies)
     min_sch = None
     min_lat = float("inf")
-    for dag in dags:
-        rst = run_scheduler(latency, dag)
-
-        if min_lat > rst.latency:
+    lower_bound = float("inf")
+    for i, dag in enumerate(dags):
+        #  Out of time, only the lower bound of the remaining splits is computed.
+        skip = deadline is not None and min_sch is not None and time.monotonic() > deadline
+
+        _deadline = deadline
+        if mode == "anneal" and deadline is not None:
+            #  Share the remaining budget between the remaining splits.
+            _deadline = time.monotonic() + (deadline - time.monotonic()) / (len(dags) - i)
+
+        #  Only a split strictly better than the best one so far can replace it.
+        rst = None
+        if not skip:
+            rst = _run_scheduler(latency, dag, upper_bound=min_lat, deadline=_deadline, mode=mode)
+
+        #  Any schedule follows one of the splits.
+        dag_latency = latency.copy()
+        for einsum in dag.keys():
+            if einsum not in dag_latency:
+                dag_latency[einsum] = [0 for _ in range(dimensions_count)]
+        lower_bound = min(lower_bound, schedule_lower_bound(
+            dag, [{op: lat[d] for op, lat in dag_latency.items()} for d in range(dimensions_count)]))
+
+        if rst is not None and min_lat > rst.latency:
             min_sch = rst
             min_lat = rst.latency
-    return min_sch
+    if min_sch is None:
+        return None
+    return replace(min_sch, lower_bound=lower_bound)
 
 def deserialize(data: list) -> Dict[str, Schedule]:
     """Deserialize and change the type of list to map.
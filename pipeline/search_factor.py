@@ -1,29 +1,21 @@
 import random
 import math
-from typing import Dict, List
+from typing import Callable, Dict, List, Tuple, Union
 from einsum import *
 from config.arch import PE
-from itertools import chain
+from itertools import chain, product
 from config.arch import ArchConfig
 from einsum.einsums import Einsums
 from pipeline.scheduler import Schedule
+from pipeline.factorize import get_divisors
 
 def generate_arrays(instance: Dict[str, int], level: int) -> List[Dict[str, int]]:
     rst = [{} for _ in range(level)]
     for dimension, value in instance.items():
         factors = []
         remaining_product = value
-
-        # Get all factors for one number.
-        def get_factors(n):
-            factors = []
-            for i in range(1, n + 1):
-                if n % i == 0:
-                    factors.append(i)
-            return factors
-
         for j in range(level-1):
-            factor = random.choice(get_factors(remaining_product))
+            factor = random.choice(get_divisors(remaining_product))
             factors.append(factor)
             remaining_product //= factor
         factors.append(remaining_product)
@@ -85,6 +77,80 @@ def get_max_l3_cache_occupy(
             max_cache = total
     return max_cache * 2  #  16-bites
 
+def sample_l3_pe_factors(
+    dimensions: List[str],
+    instance: Dict[str, int],
+    cache_storage: Dict[float, List[List[str]]],
+    einsums: Einsums,
+    pe_factors: List[object],
+    fits_pe: Callable[[object, str, int], bool],
+    max_occupy: int,
+    min_occupy: int = 0
+) -> Tuple[Dict[str, int], object]:
+    """Random L3/PE factors of the instance within [min_occupy, max_occupy] of
+    L3, and random PE factors among pe_factors that fit them.
+
+    The factors of `dimensions` and of the tensors held in L3 are drawn one
+    dimension after another. The occupancy only grows with the factors, so
+    the divisors that keep it under max_occupy with the remaining dimensions
+    at 1, and over min_occupy with them at their full size, are a range found
+    by bisection. They are tried in a random order, and a partial draw is
+    backtracked once none is left or no PE factors fit it. The other
+    dimensions do not constrain anything and are drawn directly.
+    """
+    stored = set()
+    for storage in cache_storage.values():
+        for tensor in chain(*storage):
+            stored.update(einsums.dimensions[tensor])
+    dims = [d for d in instance.keys() if d in dimensions or d in stored]
+    l3_pe_factors = {
+        d: random.choice(get_divisors(v)) for d, v in instance.items() if d not in dims
+    }
+
+    def get_occupy(i: int, value: int, rest: Callable[[str], int]) -> int:
+        factors = {**l3_pe_factors, dims[i]: value, **{d: rest(d) for d in dims[i+1:]}}
+        return get_max_l3_cache_occupy(cache_storage, factors, einsums)
+
+    def draw(i: int, pe_factors: List[object]) -> Union[Tuple[Dict[str, int], object], None]:
+        if i == len(dims):
+            return dict(l3_pe_factors), random.choice(pe_factors)
+
+        #  The divisors within the bounds are a range of the sorted divisors.
+        dim = dims[i]
+        divisors = get_divisors(instance[dim])
+        lo, hi = 0, len(divisors)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if get_occupy(i, divisors[mid], lambda d: instance[d]) < min_occupy:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, len(divisors)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if get_occupy(i, divisors[mid], lambda d: 1) <= max_occupy:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        values = list(divisors[start:lo])
+        random.shuffle(values)
+        for value in values:
+            fits = [pe for pe in pe_factors if fits_pe(pe, dim, value)]
+            if len(fits) == 0:
+                continue
+            l3_pe_factors[dim] = value
+            rst = draw(i + 1, fits)
+            if rst is not None:
+                return rst
+        l3_pe_factors.pop(dim, None)
+        return None
+
+    rst = draw(0, pe_factors)
+    if rst is None:
+        raise Exception(f"No factors of {instance} fit in {min_occupy} to {max_occupy} bytes of L3")
+    return rst
+
 def random_factors_1d(
     dimensions: List[str],
     instance: Dict[str, int],
@@ -98,40 +164,21 @@ def random_factors_1d(
         []
     )
 
-    while True:
-        _factors = generate_arrays(instance, 2)
-        dram_factors = _factors[0]
-        l3_pe_factors = _factors[1]
-
-        l3_occupy = get_max_l3_cache_occupy(
-            cache_storage=cache_storage,
-            l3_pe_factors=l3_pe_factors,
-            einsums=einsums
-        )
-        if l3_occupy > arch_config.l3_size * 1024 * 1024:
-            continue
-
-        if l3_occupy < (arch_config.l3_size-1) * 1024 * 1024:  #  Reduce the search space
-            continue
-
-        dram_factors = {d: dram_factors[d] for d in dimensions}
-        l3_pe_factors = {d: l3_pe_factors[d] for d in dimensions}
-
-        b = l3_pe_factors
-        possible_factors = []
-        for a in all_possible_PE_factors:
-            if all(b[d] >= a[d] and b[d] % a[d] == 0 for d in dimensions):
-                possible_factors.append({
-                    "PE": a
-                })
-
-        if len(possible_factors) == 0:
-            continue
+    l3_pe_factors, pe_factors = sample_l3_pe_factors(
+        dimensions,
+        instance,
+        cache_storage,
+        einsums,
+        all_possible_PE_factors,
+        lambda a, d, value: d not in a or value % a[d] == 0,
+        max_occupy=arch_config.l3_size * 1024 * 1024,
+        min_occupy=(arch_config.l3_size-1) * 1024 * 1024  #  Reduce the search space
+    )
 
-        rst = random.choice(possible_factors)
-        rst["DRAM"] = dram_factors
-        rst["L3"] = {d: (l3_pe_factors[d] // rst["PE"][d]) for d in dimensions}
-        return rst
+    rst = {"PE": pe_factors}
+    rst["DRAM"] = {d: instance[d] // l3_pe_factors[d] for d in dimensions}
+    rst["L3"] = {d: (l3_pe_factors[d] // rst["PE"][d]) for d in dimensions}
+    return rst
 
 def random_factors_2d(
     dimensions: List[str],
@@ -151,39 +198,20 @@ def random_factors_2d(
         ["B"]  #  Hack: Avoid timeloop "Arithmetic Y exceeds" broken.
     )
 
-    while True:
-        _factors = generate_arrays(instance, 2)
-        dram_factors = _factors[0]
-        l3_pe_factors = _factors[1]
-
-        l3_occupy = get_max_l3_cache_occupy(
-            cache_storage=cache_storage,
-            l3_pe_factors=l3_pe_factors,
-            einsums=einsums
-        )
-        if l3_occupy > arch_config.l3_size * 1024 * 1024:
-            continue
-
-        dram_factors = {d: dram_factors[d] for d in dimensions}
-        l3_pe_factors = {d: l3_pe_factors[d] for d in dimensions}
-
-        c = l3_pe_factors
-        possible_factors = []
-        for a in all_possible_PE_factors:
-            for b in all_possible_PE_col_factors:
-                if all((x:=(a[d]*b[d])) <= c[d] and c[d] % x == 0 for d in dimensions):
-                    possible_factors.append({
-                        "PE": a,
-                        "PE_col": b
-                    })
-
-        if len(possible_factors) == 0:
-            continue
+    l3_pe_factors, (pe_factors, pe_col_factors) = sample_l3_pe_factors(
+        dimensions,
+        instance,
+        cache_storage,
+        einsums,
+        list(product(all_possible_PE_factors, all_possible_PE_col_factors)),
+        lambda ab, d, value: d not in ab[0] or value % (ab[0][d]*ab[1][d]) == 0,
+        max_occupy=arch_config.l3_size * 1024 * 1024
+    )
 
-        rst = random.choice(possible_factors)
-        rst["DRAM"] = dram_factors
-        rst["L3"] = {d: (l3_pe_factors[d] // (rst["PE"][d]*rst["PE_col"][d])) for d in dimensions}
-        return rst
+    rst = {"PE": pe_factors, "PE_col": pe_col_factors}
+    rst["DRAM"] = {d: instance[d] // l3_pe_factors[d] for d in dimensions}
+    rst["L3"] = {d: (l3_pe_factors[d] // (rst["PE"][d]*rst["PE_col"][d])) for d in dimensions}
+    return rst
 
 def random_factors(
     dimensions: List[str],
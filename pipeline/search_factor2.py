@@ -1,7 +1,11 @@
 import random
-from typing import Dict, List
+from typing import Dict, List, Iterator, Tuple
 from config.arch import ArchConfig
-from itertools import product
+from itertools import chain, product
+from functools import lru_cache
+import numpy as np
+from pipeline.candidates import CandidateSet
+from pipeline.factorize import get_divisors, get_splits
 from einsum.core import *
 
 def generate_arrays(instance: Dict[str, int], level: int) -> List[Dict[str, int]]:
@@ -9,16 +13,8 @@ def generate_arrays(instance: Dict[str, int], level: int) -> List[Dict[str, int]
     for dimension, value in instance.items():
         factors = []
         remaining_product = value
-
-        # Get all factors for one number.
-        def get_factors(n):
-            factors = []
-            for i in range(1, n + 1):
-                if n % i == 0:
-                    factors.append(i)
-            return factors
         for j in range(level-1):
-            factor = random.choice(get_factors(remaining_product))
+            factor = random.choice(get_divisors(remaining_product))
             factors.append(factor)
             remaining_product //= factor
         factors.append(remaining_product)
@@ -34,65 +30,19 @@ def random_factors(
     instance: Dict[str,int],
     min_limit: bool = False
 ):
-    pe_P = arch_config.mesh_2d
-    pe_S = arch_config.mesh_2d
-    pe_N = instance["N"]
-
-    dram_l3_factors = instance.copy()
-    assert dram_l3_factors["P"] % pe_P == 0
-    dram_l3_factors["P"] = dram_l3_factors["P"] // pe_P
-
-    assert dram_l3_factors["S"] % pe_S == 0
-    dram_l3_factors["S"] = dram_l3_factors["S"] // pe_S
-
-    assert dram_l3_factors["N"] % pe_N == 0
-    dram_l3_factors["N"] = dram_l3_factors["N"] // pe_N
-
-    l3_H = dram_l3_factors["H"]
-    dram_l3_factors["H"] = 1
-
-    l3_E = dram_l3_factors["E"]
-    dram_l3_factors["E"] = 1
-
-    l3_F = dram_l3_factors["F"]
-    dram_l3_factors["F"] = 1
-
-    while True:
-        _factors = generate_arrays(dram_l3_factors, level=2)
-        dram_factors = _factors[0]
-        l3_factors = _factors[1]
-        l3_factors["H"] = l3_H
-        l3_factors["E"] = l3_E
-        l3_factors["F"] = l3_F
-
-        avail_l3 = arch_config.l3_size * (2**20)
-        l3_occupy = get_l3_cache(l3_factors, pe_P, pe_S, pe_N)
-        if avail_l3 < l3_occupy:
-            continue
-        if min_limit and avail_l3 - (2**20) > l3_occupy:
-            continue
-
-        pe_factors = {k: 1 for k in instance.keys()}
-        pe_factors["P"] = pe_P
-        pe_factors["N"] = pe_N
-        pe_factors["S"] = pe_S
-        return {
-            "DRAM": dram_factors,
-            "L3": l3_factors,
-            "PE": pe_factors
-        }
+    """Random factors that fit in L3, drawn uniformly from `get_all_candidates`.
+    """
+    candidates = get_all_candidates(arch_config, instance, min_limit)
+    if len(candidates) == 0:
+        raise Exception(f"No factors of {instance} fit in L3 of {arch_config.name}, min_limit {min_limit}")
+    return random.choice(candidates)
+
+def generate_factors(value: int, n: int) -> List[Tuple[int]]:
+    """All the ordered ways to split value into n factors.
+    """
+    return list(get_splits(value, n))
 
 def split_dict_values(x, n):
-    def generate_factors(value, n):
-        if n == 1:
-            return [(value,)]
-        factors = []
-        for i in range(1, abs(value) + 1):
-            if value % i == 0:
-                sub_factors = generate_factors(value // i, n - 1)
-                factors.extend([(i,) + sf for sf in sub_factors])
-        return factors
-
     # print(x)
     split_options = {key: generate_factors(val, n) for key, val in x.items()}
     # print(split_options)
@@ -112,7 +62,30 @@ def get_all_candidates(
     arch_config: ArchConfig,
     instance: Dict[str,int],
     min_limit: bool = False
-) -> List[Dict[str, Dict[str, int]]]:
+) -> CandidateSet:
+    """The factors of `iter_candidate_rows` in a CandidateSet, for random access.
+    """
+    dims = list(instance.keys())
+    rows = iter_candidate_rows(arch_config, instance, min_limit)
+    data = np.fromiter(chain.from_iterable(row.ravel() for row in rows), dtype=np.int32)
+    return CandidateSet(["DRAM", "L3", "PE"], dims, data.reshape(-1, 3, len(dims)))
+
+def iter_candidate_rows(
+    arch_config: ArchConfig,
+    instance: Dict[str,int],
+    min_limit: bool = False
+) -> Iterator[np.ndarray]:
+    """The factors that fit in L3, in the order of split_dict_values, each as
+    a (DRAM, L3, PE) x dims array.
+
+    The (DRAM, L3) splits are chosen depth-first one dimension after another,
+    with all the splits of a dimension checked at once. The L3 occupancy only
+    grows with the L3 factors, so a partial split is cut once it does not fit
+    in L3 with the remaining dimensions at 1 in L3, or, with min_limit, once
+    it leaves more than 1MB free with the remaining dimensions fully in L3.
+    Only the current partial split is held, so the memory does not grow with
+    the number of candidates.
+    """
     pe_P = arch_config.mesh_2d
     pe_S = arch_config.mesh_2d
     pe_N = instance["N"]
@@ -127,117 +100,120 @@ def get_all_candidates(
     assert dram_l3_factors["N"] % pe_N == 0
     dram_l3_factors["N"] = dram_l3_factors["N"] // pe_N
 
-    l3_H = dram_l3_factors["H"]
-    dram_l3_factors["H"] = 1
-
-    l3_E = dram_l3_factors["E"]
-    dram_l3_factors["E"] = 1
-
-    l3_F = dram_l3_factors["F"]
-    dram_l3_factors["F"] = 1
-
-    _all_factors = split_dict_values(dram_l3_factors, 2)
-    _possible_factors = []
-    for _fac in _all_factors:
-        dram_factors = _fac[0].copy()
-        l3_factors = _fac[1].copy()
-        l3_factors["H"] = l3_H
-        l3_factors["E"] = l3_E
-        l3_factors["F"] = l3_F
-
-        avail_l3 = arch_config.l3_size * (2**20)
-        l3_occupy = get_l3_cache(l3_factors, pe_P, pe_S, pe_N)
-        if avail_l3 < l3_occupy:
-            continue
-        if min_limit and avail_l3 - (2**20) > l3_occupy:
-            continue
-
-        pe_factors = {k: 1 for k in instance.keys()}
-        pe_factors["P"] = pe_P
-        pe_factors["N"] = pe_N
-        pe_factors["S"] = pe_S
-        _possible_factors.append({
-            "DRAM": dram_factors,
-            "L3": l3_factors,
-            "PE": pe_factors
-        })
-    return _possible_factors
+    #  H, E and F stay in L3.
+    fixed_l3 = {dim: dram_l3_factors[dim] for dim in ["H", "E", "F"]}
+    for dim in fixed_l3:
+        dram_l3_factors[dim] = 1
+
+    avail_l3 = arch_config.l3_size * (2**20)
+    dims = list(dram_l3_factors.keys())
+    columns = [L3_DIMS.index(dim) for dim in dims]
+    model = get_l3_cache_model(pe_P, pe_S, pe_N)
+    splits = [np.array(generate_factors(dram_l3_factors[dim], 2), dtype=np.int64) for dim in dims]
+
+    pe_factors = {k: 1 for k in instance.keys()}
+    pe_factors["P"] = pe_P
+    pe_factors["N"] = pe_N
+    pe_factors["S"] = pe_S
+    pe_row = np.array([pe_factors[dim] for dim in dims], dtype=np.int64)
+
+    #  The current partial split, in L3_DIMS order.
+    dram_factors = np.ones(len(L3_DIMS), dtype=np.int64)
+    l3_factors = np.ones(len(L3_DIMS), dtype=np.int64)
+    for dim, val in fixed_l3.items():
+        l3_factors[L3_DIMS.index(dim)] = val
+
+    def extend(k: int) -> Iterator[np.ndarray]:
+        if k == len(dims):
+            yield np.stack([dram_factors[columns], l3_factors[columns], pe_row])
+            return
+
+        col = columns[k]
+        rows = np.repeat(l3_factors[None, :], len(splits[k]), axis=0)
+        if dims[k] not in fixed_l3:
+            rows[:, col] = splits[k][:, 1]
+
+        keep = model.get_occupy(rows) <= avail_l3
+        if min_limit:
+            max_rows = rows.copy()
+            for _dim, _col in zip(dims[k+1:], columns[k+1:]):
+                if _dim not in fixed_l3:
+                    max_rows[:, _col] = dram_l3_factors[_dim]
+            keep &= model.get_occupy(max_rows) >= avail_l3 - (2**20)
+
+        l3_val = l3_factors[col]
+        for j in np.nonzero(keep)[0]:
+            dram_factors[col] = splits[k][j, 0]
+            l3_factors[col] = rows[j, col]
+            yield from extend(k + 1)
+        dram_factors[col] = 1
+        l3_factors[col] = l3_val
+
+    yield from extend(0)
+
+def iter_candidates(
+    arch_config: ArchConfig,
+    instance: Dict[str,int],
+    min_limit: bool = False
+) -> Iterator[Dict[str, Dict[str, int]]]:
+    """The factors of `iter_candidate_rows` as dicts, one at a time.
+    """
+    dims = list(instance.keys())
+    for row in iter_candidate_rows(arch_config, instance, min_limit):
+        yield {level: dict(zip(dims, vals)) for level, vals in zip(["DRAM", "L3", "PE"], row.tolist())}
+
+L3_DIMS = ["B", "D", "E", "F", "H", "M", "N", "P", "S"]
+
+class L3CacheModel:
+    """The L3 occupancy of `get_l3_cache`, compiled into dimension exponents.
+
+    Every tensor held in L3 is a term coef * prod(dim ** exponent) over the
+    L3 (times PE) factors and min(H, 4). The occupancy of a group is the sum
+    of its terms and the occupancy of the factors is the max over the groups.
+    """
+    def __init__(self, pe_P: int, pe_S: int, pe_N: int):
+        self.columns = L3_DIMS + ["H4"]  #  H4 is min(H, 4).
+        self.scale = np.array([{"N": pe_N, "P": pe_P, "S": pe_S}.get(dim, 1) for dim in L3_DIMS])
+
+        QKV = ["BHEP", "BHEMN", "BHFMN", "BDP", "BDMN", "DHE", "DHE", "DHF", "BHP", "BHFP", "BHP", "BHFP"]
+        MHA = ["BHEP", "BHEMN", "BHFMN", "BHP", "BHFP", "BHP", "BHFP"]
+        groups = [
+            [(1, term) for term in QKV],
+            #  Improve H
+            [(1, term) for term in MHA] + [(pe_P*2, ["H4", "N"]), (pe_P*8*2, ["H4"])],
+            [(1, "BHFP"), (1, "BHFP"), (1, "BHFP"), (2*2*pe_P*2, "B")],
+            [(1, "BHFP"), (1, "FHS"), (1, "SP"), (2, "S"), (1, "BFHP"), (pe_P*2, "S")]
+        ]
+        for einsums in [QKV_EINSUMS, MHA_EINSUMS, ANORM_EINSUMS, FFN_EINSUMS]:
+            for name in einsums.names:
+                einsum = Einsum.load_from_einsums(name, einsums)
+                params = [einsum.get_name()] + einsum.get_inputs()
+                groups.append([(1, einsums.dimensions[p]) for p in params])
+
+        terms = [term for group in groups for term in group]
+        self.exponents = np.zeros((len(terms), len(self.columns)))
+        self.weights = np.zeros((len(terms), len(groups)))
+        t = 0
+        for g, group in enumerate(groups):
+            for coef, dims in group:
+                for dim in dims:
+                    self.exponents[t, self.columns.index(dim)] += 1
+                self.weights[t, g] = coef * 2  #  16-bit
+                t += 1
+
+    def get_occupy(self, l3_factors: np.ndarray) -> np.ndarray:
+        """The L3 occupancy in bytes of each row of L3 factors, in L3_DIMS order.
+        """
+        factors = np.asarray(l3_factors, dtype=np.float64) * self.scale
+        H = factors[:, L3_DIMS.index("H")]
+        factors = np.concatenate([factors, np.minimum(H, 4)[:, None]], axis=1)
+        values = np.prod(factors[:, None, :] ** self.exponents[None, :, :], axis=2)
+        return (values @ self.weights).max(axis=1)
+
+@lru_cache(maxsize=None)
+def get_l3_cache_model(pe_P: int, pe_S: int, pe_N: int) -> L3CacheModel:
+    return L3CacheModel(pe_P, pe_S, pe_N)
 
 def get_l3_cache(l3_factors, pe_P, pe_S, pe_N):
-    l3_pe_factors = l3_factors.copy()
-    l3_pe_factors["N"] *= pe_N
-    l3_pe_factors["P"] *= pe_P
-    l3_pe_factors["S"] *= pe_S
-    B = l3_pe_factors["B"]
-    D = l3_pe_factors["D"]
-    H = l3_pe_factors["H"]
-    E = l3_pe_factors["E"]
-    F = l3_pe_factors["F"]
-    M = l3_pe_factors["M"]
-    N = l3_pe_factors["N"]
-    P = l3_pe_factors["P"]
-    S = l3_pe_factors["S"]
-
-    #  For Q, K, V.
-    def get_QKV_cache(B, D, H, E, F, M, N, P, S, pe_P) -> float:
-        Q = B*H*E*P
-        BK = B*H*E*M*N
-        BV = B*H*F*M*N
-        INP1 = B*D*P
-        INP2 = B*D*M*N
-        WQ = D*H*E
-        WK = D*H*E
-        WV = D*H*F
-
-        RM = B*H*P
-        RNV = B*H*F*P
-        RD = B*H*P
-        AV = B*H*F*P
-        return sum([Q, BK, BV, INP1, INP2, WQ, WK, WV, RM, RNV, RD, AV]) * 2
-
-    #  For MHA
-    def get_MHA_cache(B, D, H, E, F, M, N, P, S, pe_P) -> float:
-        Q = B*H*E*P
-        BK = B*H*E*M*N
-        BV = B*H*F*M*N
-        RM = B*H*P
-        RNV = B*H*F*P
-        RD = B*H*P
-        AV = B*H*F*P
-
-        #  Improve H
-        block_cache = min(H, 4)*N*pe_P*2 + min(H, 4)*pe_P*8 * 2
-        return (sum([Q, BK, BV, RM, RNV, RD, AV]) + block_cache) * 2
-
-    def get_ANORM_cache(B, D, H, E, F, M, N, P, S, pe_P) -> float:
-        AV = B*H*F*P
-        INP = B*H*F*P
-        NR = B*H*F*P
-
-        block_cache = 2*2*B*pe_P * 2
-        return (sum([AV, INP, NR]) + block_cache) * 2
-
-    def get_FFN_cache(B, D, H, E, F, M, N, P, S, pe_P) -> float:
-        NR = B*H*F*P
-        WF = F*H*S
-        WF2 = S*P
-        BF = S*2
-        FFNT = B*F*H*P
-
-        block_cache = S*pe_P * 2
-        return (sum([NR, WF, WF2, BF, FFNT]) + block_cache) * 2
-
-    einsums_group: List[Einsums] = [QKV_EINSUMS, MHA_EINSUMS, ANORM_EINSUMS, FFN_EINSUMS]
-    einsums_max_occpuy = max([
-        Einsum.load_from_einsums(name, einsums).get_l3_occupy(l3_pe_factors)
-        for einsums in einsums_group
-        for name in einsums.names
-    ])
-
-    return max([
-        get_QKV_cache(B, D, H, E, F, M, N, P, S, pe_P),
-        get_MHA_cache(B, D, H, E, F, M, N, P, S, pe_P),
-        get_ANORM_cache(B, D, H, E, F, M, N, P, S, pe_P),
-        get_FFN_cache(B, D, H, E, F, M, N, P, S, pe_P),
-        einsums_max_occpuy
-    ])
+    model = get_l3_cache_model(pe_P, pe_S, pe_N)
+    return int(model.get_occupy(np.array([[l3_factors[dim] for dim in L3_DIMS]]))[0])
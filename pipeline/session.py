@@ -5,11 +5,17 @@ from pipeline.instance import Instance
 from config.arch import ArchConfig, ARCH_CLOUD, ARCH_EDGE
 from pipeline.search_factor import random_factors, l3_cache_storage
 from pathlib import Path
-from engine.timeloop import TimeloopResult, eval_model
+from engine.timeloop import TimeloopResult, eval_model, load_result
 from engine.accelergy_model import eval_energy, eval_energy2
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Union, Callable, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+import os
 from einsum.core import Einsum, Einsums
 from pipeline.scheduler import Schedule, run_scheduler2, ScheduleResult
+from pipeline.cache import TimeloopCache, TIMELOOP_CACHE, ScheduleCache, SCHEDULE_CACHE
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 @dataclass
 class SessionInput:
@@ -28,9 +34,35 @@ class SessionOutput:
     tl_rst: TimeloopResult
     factors: Dict[str, Dict[str, int]]
 
+#  Upper bound of the einsums evaluated at the same time by one session.
+EINSUM_WORKERS = min(12, os.cpu_count() or 1)
+
 class Session:
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        cache: Union[TimeloopCache, None] = TIMELOOP_CACHE,
+        workers: int = EINSUM_WORKERS
+    ):
+        """
+        Args:
+            cache (Union[TimeloopCache, None], optional): The cache of Timeloop
+                runs shared by the sessions. None disables caching.
+            workers (int, optional): The number of einsums evaluated
+                concurrently by `map`.
+        """
+        self.cache = cache
+        self.workers = workers
+
+    def map(self, func: Callable[[T], R], items: List[T]) -> List[R]:
+        """Apply func to the items on a bounded thread pool.
+
+        Every einsum runs Timeloop in its own outdir, so they are independent
+        once the schedule is known. The results keep the order of the items.
+        """
+        if self.workers <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as executor:
+            return list(executor.map(func, items))
 
     def call_timeloop(
         self,
@@ -46,13 +78,25 @@ class Session:
             arch_mapping_problem_path,
             [arch, mapping, problem])
 
-        return eval_model(
+        compute_cost = einsum.einsums.compute_cost[einsum.name]
+        key = None
+        if self.cache is not None:
+            key = self.cache.get_key([arch, mapping, problem])
+            stats = self.cache.get(key, outdir)
+            if stats is not None:
+                return load_result(stats, arch_config, compute_cost)
+
+        rst = eval_model(
             [arch_mapping_problem_path],
             outdir=outdir,
             arch_config=arch_config,
-            compute_cost=einsum.einsums.compute_cost[einsum.name]
+            compute_cost=compute_cost
         )
 
+        if self.cache is not None:
+            self.cache.put(key, outdir)
+        return rst
+
     def load_uninit_arch(self, pe: PE) -> Architecture:
         base_dir = Path(__file__).parent
         arch = None
@@ -185,8 +229,23 @@ def search_scheduler(
     seq_len: str,
     einsums: Einsums,
     arch_config: ArchConfig,
-    MHA_Improve_H: int = 1
+    MHA_Improve_H: int = 1,
+    cache: ScheduleCache = SCHEDULE_CACHE,
+    mode: str = "exact",
+    time_budget: Union[float, None] = None
 ) -> ScheduleResult:
+    """Schedule an einsum group, see `run_scheduler2`.
+
+    Args:
+        mode (str, optional): The mode of `run_scheduler2`. Defaults to "exact".
+        time_budget (Union[float, None], optional): The time budget of
+            `run_scheduler2`. Defaults to None (exact).
+    """
+    key = cache.get_key(model, seq_len, einsums, arch_config, MHA_Improve_H, mode, time_budget)
+    sch_rst = cache.get(key)
+    if sch_rst is not None:
+        return sch_rst
+
     mesh_1d = arch_config.mesh_1d
     mesh_2d = arch_config.mesh_2d
     clock_feq = arch_config.global_clock
@@ -224,5 +283,8 @@ def search_scheduler(
 
         if "divide" in einsums.compute_cost[einsum] or "max" in einsums.compute_cost[einsum]:
             latency[einsum][1] = float("inf")
-    sch_rst = run_scheduler2(latency, einsums.dependency)
+    sch_rst = run_scheduler2(latency, einsums.dependency, time_budget=time_budget, mode=mode)
+    if mode != "exact" or time_budget is not None:
+        print(f"Scheduled {model}, {seq_len}, {einsums.name} within {sch_rst.gap:.1%} of the lower bound.")
+    cache.put(key, sch_rst)
     return sch_rst
\ No newline at end of file
@@ -0,0 +1,273 @@
+from pathlib import Path
+from typing import Union, Dict, List, Tuple
+import sqlite3
+import json
+import csv
+import os
+
+FACTOR_LEVELS = ["DRAM", "L3", "PE", "PE_col", "reg_file"]
+
+def factors_to_key(factors: Dict[str, Dict[str, int]]) -> str:
+    """Canonical text of the factors, used as the lookup key of the store.
+    """
+    return json.dumps(
+        {level: {dim: int(val) for dim, val in facs.items()} for level, facs in factors.items()},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+
+class ResultStore:
+    """Transactional store of the pregenerated (factors -> latency, energy) results.
+
+    It is a SQLite database in WAL mode, so several processes can search and
+    write the same (arch, model, seq_len) at the same time. The csv files
+    that used to be appended under `pipeline/pregenerate` are imported once
+    on first use.
+    """
+    def __init__(
+        self,
+        db_file: Union[str, Path] = Path(__file__).parent / "pregenerate" / "pregenerate.db",
+        csv_dir: Union[str, Path, None] = Path(__file__).parent / "pregenerate",
+        timeout: float = 60
+    ):
+        self.db_file = Path(db_file)
+        self.csv_dir = None if csv_dir is None else Path(csv_dir)
+        self.timeout = timeout
+        self._conn: sqlite3.Connection = None
+        self._pid = None
+        self._imported = False
+
+    def connect(self) -> sqlite3.Connection:
+        #  sqlite connections must not be shared across forked processes.
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = self.open()
+            self._pid = os.getpid()
+            self._imported = self.csv_dir is None
+
+        if not self._imported:
+            #  Set first, since the import connects again. A failed import is
+            #  retried on the next call; each file is imported in one transaction.
+            self._imported = True
+            try:
+                self.import_csv_dir(self.csv_dir)
+            except BaseException:
+                self._imported = False
+                raise
+        return self._conn
+
+    def open(self) -> sqlite3.Connection:
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_file, timeout=self.timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                arch TEXT NOT NULL,
+                model TEXT NOT NULL,
+                seq_len TEXT NOT NULL,
+                factors TEXT NOT NULL,
+                latency REAL NOT NULL,
+                energy REAL NOT NULL,
+                details TEXT,
+                PRIMARY KEY (arch, model, seq_len, factors)
+            )""")
+        conn.execute("CREATE TABLE IF NOT EXISTS imported (file TEXT PRIMARY KEY)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                arch TEXT NOT NULL,
+                model TEXT NOT NULL,
+                seq_len TEXT NOT NULL,
+                factors TEXT NOT NULL,
+                latency REAL NOT NULL,
+                energy REAL NOT NULL,
+                PRIMARY KEY (arch, model, seq_len, factors)
+            )""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analytical (
+                arch TEXT NOT NULL,
+                model TEXT NOT NULL,
+                seq_len TEXT NOT NULL,
+                factors TEXT NOT NULL,
+                latency REAL NOT NULL,
+                energy REAL NOT NULL,
+                dram_traffic REAL NOT NULL,
+                full_latency REAL,
+                full_energy REAL,
+                PRIMARY KEY (arch, model, seq_len, factors)
+            )""")
+        #  Databases from before the full result was recorded with the estimate.
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(analytical)")]
+        for column in ["full_latency", "full_energy"]:
+            if column not in columns:
+                conn.execute(f"ALTER TABLE analytical ADD COLUMN {column} REAL")
+        return conn
+
+    def import_csv_dir(self, csv_dir: Path):
+        """Import every `<arch>_<model>_<seq_len>.csv` of csv_dir that was not imported yet.
+        """
+        for file in sorted(Path(csv_dir).glob("*.csv")):
+            self.import_csv(file)
+
+    def import_csv(self, file: Path):
+        conn = self.connect()
+        arch, model, seq_len = file.stem.split("_", 2)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM imported WHERE file = ?", (file.name,)).fetchone() is None:
+                rows = []
+                with open(file, newline="", encoding="utf-8") as csvfile:
+                    for row in csv.DictReader(csvfile):
+                        factors = {}
+                        details = {}
+                        for col, val in row.items():
+                            level, _, dim = col.partition(".")
+                            if level in FACTOR_LEVELS:
+                                factors.setdefault(level, {})[dim] = int(val)
+                            elif col not in ["latency", "energy"]:
+                                details[col] = float(val)
+                        rows.append((
+                            arch, model, seq_len, factors_to_key(factors),
+                            float(row["latency"]), float(row["energy"]), json.dumps(details)
+                        ))
+                conn.executemany("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("INSERT INTO imported VALUES (?)", (file.name,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def insert(
+        self,
+        arch: str,
+        model: str,
+        seq_len: str,
+        factors: Dict[str, Dict[str, int]],
+        latency: float,
+        energy: float,
+        details: Dict[str, float] = {}
+    ):
+        """Insert one result. The first result stored for some factors is kept.
+        """
+        conn = self.connect()
+        conn.execute(
+            "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (arch, model, seq_len, factors_to_key(factors), latency, energy, json.dumps(details))
+        )
+
+    def get(
+        self,
+        arch: str,
+        model: str,
+        seq_len: str,
+        factors: Dict[str, Dict[str, int]]
+    ) -> Union[Dict[str, float], None]:
+        conn = self.connect()
+        row = conn.execute(
+            "SELECT latency, energy FROM results WHERE arch = ? AND model = ? AND seq_len = ? AND factors = ?",
+            (arch, model, seq_len, factors_to_key(factors))
+        ).fetchone()
+        if row is None:
+            return None
+        return {"latency": row[0], "energy": row[1]}
+
+    def get_since(self, arch: str, model: str, seq_len: str, rowid: int = 0) -> Tuple[List[Dict[str, object]], int]:
+        """The results of (arch, model, seq_len) stored after the row `rowid`.
+
+        Returns:
+            Tuple[List[Dict[str, object]], int]: The results, and the last row
+                seen, to pass as `rowid` on the next call.
+        """
+        conn = self.connect()
+        rows = conn.execute(
+            "SELECT rowid, factors, latency, energy FROM results WHERE rowid > ? AND arch = ? AND model = ? AND seq_len = ?",
+            (rowid, arch, model, seq_len)
+        ).fetchall()
+        last = max([rowid] + [row[0] for row in rows])
+        return [{"factors": json.loads(f), "latency": lat, "energy": eng} for _, f, lat, eng in rows], last
+
+    def get_all(self, arch: str, model: str, seq_len: str) -> List[Dict[str, object]]:
+        """All the results of (arch, model, seq_len), with their factors.
+        """
+        conn = self.connect()
+        rows = conn.execute(
+            "SELECT factors, latency, energy FROM results WHERE arch = ? AND model = ? AND seq_len = ?",
+            (arch, model, seq_len)
+        ).fetchall()
+        return [{"factors": json.loads(f), "latency": lat, "energy": eng} for f, lat, eng in rows]
+
+    def insert_prediction(
+        self,
+        arch: str,
+        model: str,
+        seq_len: str,
+        factors: Dict[str, Dict[str, int]],
+        latency: float,
+        energy: float
+    ):
+        """Record the surrogate prediction of some factors, see pipeline.surrogate.
+        """
+        conn = self.connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+            (arch, model, seq_len, factors_to_key(factors), latency, energy)
+        )
+
+    def get_predictions(self, arch: str, model: str, seq_len: str) -> List[Dict[str, object]]:
+        """The recorded predictions of (arch, model, seq_len) next to their true results.
+        """
+        conn = self.connect()
+        rows = conn.execute("""
+            SELECT p.factors, p.latency, p.energy, r.latency, r.energy
+            FROM predictions p JOIN results r USING (arch, model, seq_len, factors)
+            WHERE p.arch = ? AND p.model = ? AND p.seq_len = ?""",
+            (arch, model, seq_len)
+        ).fetchall()
+        return [{
+            "factors": json.loads(f),
+            "predicted_latency": p_lat, "predicted_energy": p_eng,
+            "latency": lat, "energy": eng
+        } for f, p_lat, p_eng, lat, eng in rows]
+
+    def insert_analytical(
+        self,
+        arch: str,
+        model: str,
+        seq_len: str,
+        factors: Dict[str, Dict[str, int]],
+        latency: float,
+        energy: float,
+        dram_traffic: float,
+        full_latency: Union[float, None] = None,
+        full_energy: Union[float, None] = None
+    ):
+        """Record the analytical estimate of some factors, see pipeline.analytical,
+        with their full result if known.
+        """
+        conn = self.connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO analytical VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (arch, model, seq_len, factors_to_key(factors), latency, energy, dram_traffic, full_latency, full_energy)
+        )
+
+    def get_analytical(self, arch: str, model: str, seq_len: str) -> List[Dict[str, object]]:
+        """The recorded analytical estimates of (arch, model, seq_len) next to their true results.
+
+        The full result is the one recorded with the estimate, or else the stored one.
+        """
+        conn = self.connect()
+        rows = conn.execute("""
+            SELECT a.factors, a.latency, a.energy, a.dram_traffic,
+                COALESCE(a.full_latency, r.latency), COALESCE(a.full_energy, r.energy)
+            FROM analytical a LEFT JOIN results r USING (arch, model, seq_len, factors)
+            WHERE a.arch = ? AND a.model = ? AND a.seq_len = ?
+                AND COALESCE(a.full_latency, r.latency) IS NOT NULL""",
+            (arch, model, seq_len)
+        ).fetchall()
+        return [{
+            "factors": json.loads(f),
+            "analytical_latency": a_lat, "analytical_energy": a_eng, "analytical_dram_traffic": a_traffic,
+            "latency": lat, "energy": eng
+        } for f, a_lat, a_eng, a_traffic, lat, eng in rows]
+
+RESULT_STORE = ResultStore()
@@ -0,0 +1,56 @@
+from typing import Dict, List, Union
+import numpy as np
+from config.arch import ArchConfig
+from pipeline.candidates import CandidateSet
+from pipeline.store import ResultStore
+
+SURROGATE_DIMS = ["B", "D", "M", "P", "S"]
+
+class Surrogate:
+    """Log-linear model of the latency and energy of some factors.
+
+    log(latency) and log(energy) are fitted by least squares as linear
+    functions of the log2 of the L3 factors searched by MCTS, from the
+    results of one (arch, model, seq_len) in the result store.
+    """
+    def __init__(self, weights: np.ndarray, rows: int):
+        self.weights = weights  #  (1 + dims) x [latency, energy]
+        self.rows = rows
+
+    @staticmethod
+    def get_features(l3_factors: np.ndarray) -> np.ndarray:
+        l3_factors = np.asarray(l3_factors, dtype=np.float64)
+        return np.concatenate([np.ones((len(l3_factors), 1)), np.log2(l3_factors)], axis=1)
+
+    @classmethod
+    def fit(cls, results: List[Dict[str, object]]) -> "Surrogate":
+        l3_factors = [[rst["factors"]["L3"][dim] for dim in SURROGATE_DIMS] for rst in results]
+        x = cls.get_features(np.array(l3_factors).reshape(-1, len(SURROGATE_DIMS)))
+        y = np.log([[rst["latency"], rst["energy"]] for rst in results])
+        weights, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+        return cls(weights, len(results))
+
+    @classmethod
+    def from_store(
+        cls,
+        store: ResultStore,
+        arch_config: ArchConfig,
+        model: str,
+        seq_len: str,
+        min_rows: int = 8
+    ) -> Union["Surrogate", None]:
+        """Fit the surrogate on the stored results, or None if there are fewer than min_rows.
+        """
+        results = [
+            rst for rst in store.get_all(arch_config.name, model, seq_len)
+            if rst["latency"] > 0 and rst["energy"] > 0
+        ]
+        if len(results) < min_rows:
+            return None
+        return cls.fit(results)
+
+    def predict(self, candidates: CandidateSet) -> np.ndarray:
+        """The predicted (latency, energy) of every candidate.
+        """
+        l3_factors = np.stack([candidates.get_column("L3", dim) for dim in SURROGATE_DIMS], axis=1)
+        return np.exp(self.get_features(l3_factors) @ self.weights)
@@ -0,0 +1,102 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import math
+import numpy as np
+import pandas as pd
+from config.arch import ARCH_CLOUD, ARCH_EDGE
+from pipeline.candidates import CandidateSet
+from pipeline.store import ResultStore
+from pipeline.surrogate import SURROGATE_DIMS
+from results.results_io import read_factors
+
+INSTANCES_FILE = Path(__file__).parent / "instances" / "instances.csv"
+
+def get_neighbours(
+    arch: str,
+    model: str,
+    seq_len: str,
+    archs: List[str] = [ARCH_EDGE.name, ARCH_CLOUD.name]
+) -> List[Tuple[str, str, str]]:
+    """The other (arch, model, seq_len), closest to the given one first.
+
+    The distance is the log2 ratio of the sequence lengths, plus 2 for another
+    arch and 4 for another model, so that the same search at another arch
+    comes after the ones at 4x shorter or longer sequences of the same arch.
+    There are none for a (model, seq_len) missing from the instances file.
+    """
+    df = pd.read_csv(INSTANCES_FILE)
+    points = {(row["models"], row["seq_len"]): int(row["P"]) for _, row in df.iterrows()}
+    if (model, seq_len) not in points:
+        return []
+    P = points[(model, seq_len)]
+
+    neighbours = []
+    for (other_model, other_seq_len), other_P in points.items():
+        for other_arch in archs:
+            if (other_arch, other_model, other_seq_len) == (arch, model, seq_len):
+                continue
+            distance = abs(math.log2(other_P / P)) + 2 * (other_arch != arch) + 4 * (other_model != model)
+            neighbours.append((distance, (other_arch, other_model, other_seq_len)))
+    neighbours.sort(key=lambda n: n[0])
+    return [point for _, point in neighbours]
+
+def get_known_factors(
+    store: ResultStore,
+    arch: str,
+    model: str,
+    seq_len: str,
+    get_cost: Callable[[float, float], float],
+    top_k: int = 1
+) -> List[Dict[str, Dict[str, int]]]:
+    """The best known factors of (arch, model, seq_len): the ones of its results
+    JSON, then the top_k stored ones by cost.
+    """
+    known = []
+    factors = read_factors("TransFusion", arch, model, seq_len)
+    if factors is not None:
+        known.append(factors)
+    results = sorted(store.get_all(arch, model, seq_len), key=lambda rst: get_cost(rst["latency"], rst["energy"]))
+    known += [rst["factors"] for rst in results[:top_k]]
+    return known
+
+def map_factors(candidates: CandidateSet, known: List[Dict[str, Dict[str, int]]]) -> List[int]:
+    """The candidate closest to each of the known factors, without duplicates.
+
+    Candidates are compared on the log2 of the L3 factors of the MCTS tree.
+    The best tiles of neighbouring searches mostly keep their size and only
+    the DRAM loops over P and M grow with the sequence, so the L3 factors
+    transfer as they are.
+    """
+    if len(candidates) == 0:
+        return []
+    x = np.log2(np.stack([candidates.get_column("L3", dim) for dim in SURROGATE_DIMS], axis=1))
+    indices = []
+    for factors in known:
+        y = np.log2([factors["L3"][dim] for dim in SURROGATE_DIMS])
+        index = int(np.argmin(np.abs(x - y).sum(axis=1)))
+        if index not in indices:
+            indices.append(index)
+    return indices
+
+def get_warm_start(
+    candidates: CandidateSet,
+    store: ResultStore,
+    arch: str,
+    model: str,
+    seq_len: str,
+    get_cost: Callable[[float, float], float],
+    max_neighbours: int = 4
+) -> List[int]:
+    """The candidates mapped from the best known factors of the max_neighbours
+    closest (arch, model, seq_len) that have results, closest first.
+    """
+    known = []
+    found = 0
+    for point in get_neighbours(arch, model, seq_len):
+        if found == max_neighbours:
+            break
+        factors = get_known_factors(store, *point, get_cost)
+        if len(factors) != 0:
+            known += factors
+            found += 1
+    return map_factors(candidates, known)
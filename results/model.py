@@ -34,6 +34,18 @@ MODEL_FUNC = {
     "Llama3": get_decoder_result
 }
 
+#  The einsum groups of each model in execution order, summed up by MODEL_FUNC.
+ENCODER_GROUPS = ["QKV", "MHA", "LayerNorm", "FFN", "LayerNorm"]
+DECODER_GROUPS = ["QKV", "MHA", "LayerNorm", "MHA", "LayerNorm", "FFN", "LayerNorm"]
+
+MODEL_GROUPS = {
+    "BERT": ENCODER_GROUPS,
+    "TrXL": DECODER_GROUPS,
+    "T5": ENCODER_GROUPS + DECODER_GROUPS,
+    "XLM": ENCODER_GROUPS + DECODER_GROUPS,
+    "Llama3": DECODER_GROUPS
+}
+
 def get_results_from_model(arch_config: ArchConfig, model: str, seq_len: str):
     ffn_fused = read_results("FFN", arch_config, model, seq_len, True)
     ffn_unfused = read_results("FFN", arch_config, model, seq_len, False)
@@ -136,6 +148,7 @@ def get_results_from_model(arch_config: ArchConfig, model: str, seq_len: str):
         },
         "TransFusion": {
             "latency": transfusion["latency"],
+            "pipelined_latency": transfusion["latency"] if transfusion.get("pipelined_latency") is None else transfusion["pipelined_latency"],
             "energy": transfusion["energy"],
             "1d": trans_util_1d_func(transfusion["einsums_outputs"]["QKV"], transfusion["einsums_outputs"]["MHA"], transfusion["einsums_outputs"]["LayerNorm"], transfusion["einsums_outputs"]["FFN"]),
             "2d": trans_util_2d_func(transfusion["einsums_outputs"]["QKV"], transfusion["einsums_outputs"]["MHA"], transfusion["einsums_outputs"]["LayerNorm"], transfusion["einsums_outputs"]["FFN"]),
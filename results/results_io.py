@@ -2,7 +2,7 @@ from baseline.base import BaselineOptions, BaselineOutputs
 from pathlib import Path
 import json
 from dataclasses import asdict, is_dataclass, fields
-from typing import Tuple, Union, Any
+from typing import Dict, Tuple, Union, Any
 from config.arch import ArchConfig, PE
 import pandas as pd
 from pipeline.core import TransFusionOptions, TransFusionTransformerOutputs
@@ -23,17 +23,39 @@ def recursive_asdict(obj: Any) -> Any:
     else:
         return obj
 
+def get_results_file(name: str, inp: Union[TransFusionOptions, BaselineOptions]) -> Path:
+    return Path(__file__).parent / name / f"{inp.arch_config.name}_{inp.model}_{inp.seq_len}.json"
+
 def write_results(
     name,
     inp: Union[TransFusionOptions, BaselineOptions],
     rst: Union[TransFusionTransformerOutputs, BaselineOutputs]
 ):
-    base_dir = Path(__file__).parent / name
-    base_dir.mkdir(parents=True, exist_ok=True)
-    rst_file = base_dir / f"{inp.arch_config.name}_{inp.model}_{inp.seq_len}.json"
+    rst_file = get_results_file(name, inp)
+    rst_file.parent.mkdir(parents=True, exist_ok=True)
 
+    data = recursive_asdict(rst)
+    data["inputs"] = recursive_asdict(inp)
     with open(rst_file, "w") as f:
-        json.dump(recursive_asdict(rst), f, indent=4)
+        json.dump(data, f, indent=4)
+
+def has_results(name: str, inp: Union[TransFusionOptions, BaselineOptions]) -> bool:
+    """Whether the results of `name` exist and were produced from the same inputs.
+
+    Results written before the inputs were recorded are taken as produced
+    from the current inputs.
+    """
+    rst_file = get_results_file(name, inp)
+    if not rst_file.exists():
+        return False
+    try:
+        with open(rst_file, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if "inputs" not in data:
+        return True
+    return data["inputs"] == json.loads(json.dumps(recursive_asdict(inp)))
 
 def read_results(name: str, arch_config: ArchConfig, model: str, seq_len: str, fused: Union[bool, None] = None) -> Tuple[float, float]:
     base_dir = Path(__file__).parent
@@ -46,3 +68,14 @@ def read_results(name: str, arch_config: ArchConfig, model: str, seq_len: str, f
         data = json.load(f)
     return data["latency"], data["energy"]
 
+
+def read_factors(name: str, arch: str, model: str, seq_len: str) -> Union[Dict[str, Dict[str, int]], None]:
+    """The factors stored with the results of `name`, or None if there are none.
+    """
+    rst_file = Path(__file__).parent / name / f"{arch}_{model}_{seq_len}.json"
+    try:
+        with open(rst_file, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data.get("factors")